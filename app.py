@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-"""This is a simple audio recorder that uses PyAudio and wave to record .wav files."""
+"""This is a simple audio recorder that uses PyAudio to record .wav files."""
 
 __author__ = "Hannan Khan"
 __copyright__ = "Copyright 2020, Audio Recorder"
@@ -11,25 +11,39 @@ __version__ = "1.0"
 __maintainer__ = "Hannan Khan"
 __email__ = "hannankhan888@gmail.com"
 
+import logging
+import multiprocessing
 import os
 import sys
 import threading
 import time
-import wave
 
-import pyaudio
+# Imported first, so that the startup timings include the time taken by the other imports.
+from startupTimer import startup_timer
+
 from PyQt5 import QtGui, QtWidgets, QtCore
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QMainWindow, QApplication, QGraphicsBlurEffect
-from win10toast import ToastNotifier
 
 from dynamicLabels import ColorChangingLabel, ImageChangingLabel, CustomButton
+from encoder import FORMATS, get_available_formats, get_file_dialog_filter, needs_encoding
 from framelessDialog import FramelessDialog
+from levelMeter import LevelAnalyzer, LevelMeter
+from notifier import DISPLAY_SECONDS, BannerBackend, LoggingBackend, NotificationService, get_system_backends
+from pixmapCache import PIXMAP_CACHE_DIR, pixmap_cache
+from recorderEngine import RecorderEngine
+from recorderState import RecorderState, IllegalTransitionError
+from settingsDialog import SettingsDialog
+from theme import Theme, get_theme
+from uiBridge import UiBridge
+from waveformView import MinMaxPyramid, WaveformView
+
+# How many times a second the elapsed recording time is refreshed in the UI.
+CLOCK_REFRESH_RATE = 4
+# How many of the latest seconds the live waveform shows.
+WAVEFORM_SECONDS = 10
 
-CHUNK = 1024
-SAMPLE_FORMAT = pyaudio.paInt16
-CHANNELS = 0
-FPS = 44100
+logger = logging.getLogger(__name__)
 
 
 # function needed to use PyInstaller properly:
@@ -47,14 +61,17 @@ class AudioRecorder(QMainWindow):
     """This class implements a minimalist AudioRecorder.
     Functions of the recorder include starting recording, pausing, and stopping (same
     as saving).
-    Each time a recording is started, a separate timer thread and recording thread are
-    created for that particular recording. When stop is pressed, these threads terminate."""
+    The recording itself is done by a RecorderEngine, which has no GUI dependencies; this
+    window only drives it and displays its progress. The elapsed time is counted in
+    recorded frames and shown by a QTimer on the GUI thread."""
+
+    elapsed_time_changed = QtCore.pyqtSignal(float)
 
     def __init__(self, screen_width: int, screen_height: int):
         # Set up the window's attributes.
         super(AudioRecorder, self).__init__()
         self.WIDTH = 600
-        self.HEIGHT = 338
+        self.HEIGHT = 418
         self.SCREEN_WIDTH = screen_width
         self.SCREEN_HEIGHT = screen_height
         self.X = int((self.SCREEN_WIDTH / 2) - (self.WIDTH / 2))
@@ -72,29 +89,28 @@ class AudioRecorder(QMainWindow):
         self.filename = ""
         self.current_font = QtGui.QFont("Segoe", 10)
         self.main_frame_blur = False
-        self.recording = False
-        self.paused = False
-        self.stopped = False
         self.always_on_top = False
         self.mousePressPos = None
         self.mouseMovePos = None
-        self.threads: [threading.Thread] = []
         self.total_time = 0.0
-        self.toaster = ToastNotifier()
-        self.timer_thread = None
-        self.recording_thread = None
-        self.stream = None
-        self.frames = []
+        # How many times the current recording may have lost audio, see update_clock().
+        self.gap_count = 0
+        # Whether a sound-triggered recording is waiting for sound, see update_clock().
+        self.waiting_for_sound = False
+        self.level_analyzer = None
+        self.waveform_pyramid = None
+
+        # All the recording itself is done by the engine; this window is only a client of it.
+        self.engine = RecorderEngine()
+        self.engine.on_error = self.on_engine_error
+        self.engine.on_ready = lambda: startup_timer.mark("portaudio ready")
 
         self._init_colors()
-        self._init_default_devices()
+        self._init_clock()
 
         # Set up the overall layout and frames.
         self.main_frame = QtWidgets.QFrame()
-        self.main_frame.setStyleSheet("""
-        QFrame{
-        background-color: rgba(35,61,77,255);
-        }""")
+        self.main_frame.setStyleSheet(self.theme.frame_style_sheet)
         self.main_frame_layout = QtWidgets.QVBoxLayout()
         self.main_frame_layout.setSpacing(0)
         self.main_frame_layout.setContentsMargins(0, 0, 0, 0)
@@ -108,11 +124,47 @@ class AudioRecorder(QMainWindow):
 
         self._init_window_frame()
         self._init_bottom_frame()
+        startup_timer.mark("widgets created")
+        self._init_ui_bridge()
+        self._init_notifications()
 
         self.main_frame.setLayout(self.main_frame_layout)
 
         self.setCentralWidget(self.main_frame)
         self.show()
+        # Runs once the event loop has painted the window.
+        QtCore.QTimer.singleShot(0, self.on_first_paint)
+
+    def on_first_paint(self):
+        """Starts initializing PortAudio in the background, only once the window is up. It
+        is normally ready long before the mic is clicked. Recordings interrupted by a crash
+        are recovered in the background too."""
+
+        startup_timer.mark("window painted")
+        logger.info("startup: %s", pixmap_cache.report())
+        self.engine.warm_up()
+        recovery_thread = threading.Thread(target=self.recover_recordings)
+        recovery_thread.setDaemon(True)
+        recovery_thread.setName("Recovery Thread")
+        recovery_thread.start()
+
+    def recover_recordings(self):
+        """Recovery Thread runs this function. Each recovered recording is reported on the
+        GUI thread through the "recovered" field of the UI bridge."""
+
+        def on_recovered(path: str, error: Exception):
+            self.ui_bridge.post("recovered", (os.path.basename(path), error))
+
+        self.engine.recover_recordings(on_recovered)
+
+    def on_recording_recovered(self, result: (str, Exception)):
+        """Called on the GUI thread for each recording recovered after a crash."""
+
+        filename, error = result
+        if error is not None:
+            self.show_error_dialog(f"Could not recover {filename}:\n{error}")
+            return
+        self.notify(f"Recovered interrupted recording:\n{filename}")
 
     def mousePressEvent(self, a0: QtGui.QMouseEvent) -> None:
         self.mousePressPos = None
@@ -162,20 +214,23 @@ class AudioRecorder(QMainWindow):
         self.highlight_color = QtGui.QColor()
         self.highlight_color.setRgb(111, 117, 135)
 
-    def _init_default_devices(self):
-        """Gets the dictionaries of the default input and output devices, and set the
-        default values for them."""
+        self.theme = get_theme(self.normal_bg, self.highlight_bg, self.normal_color, self.highlight_color)
 
-        self.p = pyaudio.PyAudio()
-        self.input_device_dict = pyaudio.PyAudio.get_default_input_device_info(self.p)
-        self.input_device_idx = self.input_device_dict['index']
-        self.input_device_name = self.input_device_dict["name"]
-        self.input_channels = self.input_device_dict['maxInputChannels']
-        self.default_sample_rate = self.input_device_dict['defaultSampleRate']
+    def set_theme(self, theme: Theme):
+        """Switches the window to the colors of theme at runtime. Every ColorChangingLabel
+        in it is given the shared theme, the painted views are repainted with its colors,
+        and dialogs opened afterwards use it too."""
 
-        self.output_device_dict = pyaudio.PyAudio.get_default_output_device_info(self.p)
-        self.output_device_num = self.output_device_dict['index']
-        self.output_device_name = self.output_device_dict["name"]
+        self.theme = theme
+        self.normal_bg, self.highlight_bg = theme.normal_bg, theme.highlight_bg
+        self.normal_color, self.highlight_color = theme.normal_color, theme.highlight_color
+        self.main_frame.setStyleSheet(theme.frame_style_sheet)
+        self.banner_label.setStyleSheet(theme.banner_style_sheet)
+        for label in self.findChildren(ColorChangingLabel):
+            label.set_theme(theme)
+        for view in (self.waveform_view, self.level_meter):
+            view.normal_bg, view.normal_color = theme.normal_bg, theme.normal_color
+            view.update()
 
     def _init_window_frame(self):
         self.window_frame = QtWidgets.QFrame()
@@ -249,8 +304,18 @@ class AudioRecorder(QMainWindow):
         self.current_time_label.setFont(self.current_font)
         self.current_time_label.setText("00:00:00")
 
+        # The live waveform of the last few seconds of the current recording.
+        self.waveform_view = WaveformView(self.normal_bg, self.normal_color, self.engine.rate, WAVEFORM_SECONDS)
+        self.waveform_view.setFixedSize(400, 40)
+
+        # The input level meter, one bar per input channel.
+        self.level_meter = LevelMeter(self.normal_bg, self.normal_color, self.highlight_bg)
+        self.level_meter.setFixedSize(400, 16)
+
         self.bottom_frame_layout.addWidget(self.current_recording_label)
         self.bottom_frame_layout.addWidget(self.current_time_label)
+        self.bottom_frame_layout.addWidget(self.waveform_view, alignment=Qt.AlignCenter)
+        self.bottom_frame_layout.addWidget(self.level_meter, alignment=Qt.AlignCenter)
 
         # We add the frame containing the buttons.
         self.buttons_frame = QtWidgets.QFrame()
@@ -291,12 +356,19 @@ class AudioRecorder(QMainWindow):
         self.main_frame_layout.addWidget(self.bottom_frame)
 
     def set_current_recording_text(self, text: str = "", recording: bool = False, paused: bool = False,
-                                   stopped: bool = False):
-        """Sets the current recording text based on which variable is activated."""
+                                   stopped: bool = False, encoding: bool = False):
+        """Sets the current recording text based on which variable is activated. The
+        current recording's dropouts, if any, are shown after its name."""
 
         if not text:
             text = self.filename
-        if recording:
+            if self.gap_count:
+                text += f" ({self.gap_count} dropout{'s' if self.gap_count > 1 else ''})"
+        if encoding:
+            self.current_recording_label.setText(f"Encoding: {text}")
+        elif recording and self.waiting_for_sound:
+            self.current_recording_label.setText(f"Waiting for sound: {text}")
+        elif recording:
             self.current_recording_label.setText(f"Recording: {text}")
         elif paused:
             self.current_recording_label.setText(f"Paused: {text}")
@@ -318,186 +390,275 @@ class AudioRecorder(QMainWindow):
             self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
             self.show()
 
-    def _start_timer_thread(self):
-        """This function starts a timer thread each time a recording starts. Each recording
-        has a timer thread and a recording thread. When paused the timer thread will
-        emulate sleep by sleeping for .2 seconds, and updating the current and total
-        recording time."""
-
-        start_time = time.time()
-        self.timer_thread = threading.Thread(target=self.start_timer, args=(start_time,))
-        self.timer_thread.setDaemon(True)
-        self.timer_thread.setName("Timer Thread")
-        self.timer_thread.start()
-        self.threads.append(self.timer_thread)
-
-    def start_timer(self, start_time):
-        """Timer thread runs this function. When self.stopped is True, this thread will
-        return and terminate."""
-
-        diff_time = 0.0
-        self.total_time = 0.0
-        while True:
-            if self.paused:
-                start_time = time.time()
-                self.total_time = diff_time
-                time.sleep(.2)
-            if self.recording:
-                time.sleep(1)
-                diff_time = time.time() - start_time + self.total_time
-                self.set_current_time_text(diff_time)
-            if self.stopped:
-                self.set_current_time_text(0)
-                return
+    def _init_ui_bridge(self):
+        """Sets up the bridge that worker threads use to update the UI. Worker threads never
+        call widget methods directly; they post to one of these fields instead, and the
+        values are delivered on the GUI thread."""
+
+        self.ui_bridge = UiBridge(self)
+        self.ui_bridge.connect("time", self.set_current_time_text)
+        self.ui_bridge.connect("status", self.current_recording_label.setText)
+        self.ui_bridge.connect("error", self.on_recording_error, coalesce=False)
+        self.ui_bridge.connect("encoded", self.on_encode_finished, coalesce=False)
+        self.ui_bridge.connect("recovered", self.on_recording_recovered, coalesce=False)
+
+    def on_engine_error(self, error: Exception):
+        """Called by the engine from the recording thread when the recording fails."""
+
+        self.ui_bridge.post("status", f"Stopped: {self.filename}")
+        self.ui_bridge.post("error", f"Recording failed:\n{error}")
+
+    def on_recording_error(self, message: str):
+        """Called on the GUI thread when the recording thread fails. Resets the UI for a new
+        recording and shows the error."""
+
+        self.clock_timer.stop()
+        self.level_meter.set_analyzer(None)
+        self.waveform_view.set_pyramid(None)
+        for button in (self.record_button_label, self.pause_button_label):
+            if button.active:
+                button.invert_active_state()
+        self.engine.chunk_listeners = []
+        self.filepath = ""
+        self.filename = ""
+        self.show_error_dialog(message)
+
+    def _init_clock(self):
+        """Sets up the recording clock. The elapsed time is derived from the number of frames
+        the recording thread has handed to the writer, so it always matches the audio in the
+        file, pauses included. A QTimer on the GUI thread samples it CLOCK_REFRESH_RATE times
+        a second and publishes it through the elapsed_time_changed signal."""
+
+        self.clock_timer = QtCore.QTimer(self)
+        self.clock_timer.setInterval(int(1000 / CLOCK_REFRESH_RATE))
+        self.clock_timer.timeout.connect(self.update_clock)
+        self.elapsed_time_changed.connect(self.set_current_time_text)
+
+    def update_clock(self):
+        """Called by the clock timer. Only emits elapsed_time_changed when the displayed
+        second changes, and updates the recording text when the capture health reports a
+        new dropout, or a sound-triggered recording starts or stops waiting for sound."""
+
+        elapsed_time = self.engine.get_elapsed_time()
+        if int(elapsed_time) != int(self.total_time):
+            self.elapsed_time_changed.emit(elapsed_time)
+        self.total_time = elapsed_time
+        health = self.engine.health
+        gap_count = health.get_gap_count() if health is not None else self.gap_count
+        waiting_for_sound = self.engine.is_waiting_for_sound()
+        if gap_count != self.gap_count or waiting_for_sound != self.waiting_for_sound:
+            self.gap_count = gap_count
+            self.waiting_for_sound = waiting_for_sound
+            if self.engine.state.get_state() is RecorderState.RECORDING:
+                self.set_current_recording_text(recording=True)
 
     def set_current_time_text(self, diff_time: float):
         """Sets the current time text with correct time conversion."""
 
         self.current_time_label.setText(time.strftime("%H:%M:%S", time.gmtime(diff_time)))
 
-    def _start_recording_thread(self):
-        """This function will create and start the recording thread. One recording thread
-        is created for each file that is recorded."""
-
-        self.recording_thread = threading.Thread(target=self.open_continue_recording)
-        self.recording_thread.setDaemon(True)
-        self.recording_thread.setName("Recording Thread")
-        self.threads.append(self.recording_thread)
-        self.recording_thread.start()
-
-    def open_continue_recording(self):
-        """This function actually does the recording. It will open a stream and enter a
-        while True loop. If paused, it will stop the stream and sleep for .2 seconds. If
-        recording, it will check to see if the stream is started, and then record. When
-        stopping, the loop will stop the stream, close it, and return, causing the associated
-        recording thread to terminate."""
-
-        self.stream = self.p.open(format=SAMPLE_FORMAT, channels=self.input_channels,
-                                  rate=FPS, frames_per_buffer=CHUNK, input=True)
-        while True:
-            if self.recording:
-                if self.stream.is_stopped():
-                    self.stream.start_stream()
-                data = self.stream.read(1024)
-                self.frames.append(data)
-            elif self.paused:
-                if not self.stream.is_stopped():
-                    self.stream.stop_stream()
-                else:
-                    time.sleep(.2)
-            elif self.stopped:
-                self.stream.stop_stream()
-                self.stream.close()
-                return
+    def _init_notifications(self):
+        """Sets up the notification service. Notifications are shown on the desktop (as a
+        Windows toast, or through the freedesktop notification service) when the system
+        supports it, and in a banner at the top of the window otherwise. They are always
+        logged."""
+
+        self.banner_label = QtWidgets.QLabel(self)
+        self.banner_label.setFont(self.current_font)
+        self.banner_label.setAlignment(Qt.AlignCenter)
+        self.banner_label.setStyleSheet(self.theme.banner_style_sheet)
+        self.banner_label.hide()
+        self.banner_timer = QtCore.QTimer(self)
+        self.banner_timer.setSingleShot(True)
+        self.banner_timer.setInterval(DISPLAY_SECONDS * 1000)
+        self.banner_timer.timeout.connect(self.banner_label.hide)
+        self.ui_bridge.connect("banner", self.show_banner)
+
+        backends = get_system_backends(resource_path("images/icon.ico"))
+        if not backends:
+            backends.append(BannerBackend(lambda title, message: self.ui_bridge.post("banner", message)))
+        self.notifier = NotificationService(backends + [LoggingBackend()], self.app_name)
+
+    def notify(self, message: str, key: str = None):
+        """Queues a notification, and returns right away; it is shown by the notification
+        service's background thread. A notification with the same key as one posted just
+        before it replaces it."""
+
+        self.notifier.notify(message, key)
+
+    def show_banner(self, message: str):
+        """Called on the GUI thread to show a notification in the window's banner, below
+        the window frame, for DISPLAY_SECONDS."""
+
+        self.banner_label.setText(message.replace("\n", " "))
+        self.banner_label.setGeometry(0, self.window_frame.height(), self.WIDTH,
+                                      self.banner_label.sizeHint().height())
+        self.banner_label.show()
+        self.banner_label.raise_()
+        self.banner_timer.start()
+
+    def show_error_dialog(self, message: str):
+        """Shows a modal error dialog with the main frame blurred behind it."""
+
+        warning_dialog = FramelessDialog(self, message, self.normal_bg, self.highlight_bg, self.normal_color,
+                                         self.highlight_color, "Error", self.current_font)
+        self.main_frame_blur.setEnabled(True)
+        warning_dialog.exec_()
+        self.main_frame_blur.setEnabled(False)
 
     def start_recording(self):
-        """This function is called when you press the record button. It will check for user
-        errors, and provides error messages, as well as a file selection dialog for getting
-        a new file's name. When the recording is started, it will notify via the win10Toast
-        module."""
-
-        if self.recording:
-            warning_dialog = FramelessDialog(self, "A recording is already underway.", self.normal_bg,
-                                             self.highlight_bg, self.normal_color, self.highlight_color, "Error",
-                                             self.current_font)
-            self.main_frame_blur.setEnabled(True)
-            warning_dialog.exec_()
-            self.main_frame_blur.setEnabled(False)
-        elif not self.recording:
-            self.filename = ""
-            self.filepath = ""
-            self.filepath = QtWidgets.QFileDialog.getSaveFileName(self, "Save Audio As",
-                                                                  os.getcwd(), "Audio Files (*.wav)")[0]
-            if self.filepath:
-                self.filename = os.path.basename(self.filepath)
-                self.record_button_label.invert_active_state()
-                self.recording = True
-                self.paused = False
-                self.stopped = False
-                self.set_current_recording_text(recording=True)
-                self._start_timer_thread()
-                self._start_recording_thread()
-                self.toaster.show_toast(self.app_name, f"Recording Started:\n{self.filename} created.",
-                                        resource_path("images/icon.ico"), 3, True)
+        """This function is called when you press the record button. The recorder state
+        rejects starting while a recording is underway, in which case an error message is
+        shown. Otherwise it provides a file selection dialog for getting a new file's name.
+        When the recording is started, a notification is queued."""
+
+        try:
+            self.engine.state.check("start")
+            self.engine.ensure_ready()
+        except IllegalTransitionError as e:
+            self.show_error_dialog(str(e))
+            return
+        except OSError as e:
+            self.show_error_dialog(f"No input device available:\n{e}")
+            return
+        self.filename = ""
+        self.filepath = ""
+        extensions = get_available_formats()
+        self.filepath, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Save Audio As", os.getcwd(), get_file_dialog_filter(extensions))
+        if self.filepath:
+            if not os.path.splitext(self.filepath)[1]:
+                self.filepath += next((ext for ext in extensions if selected_filter == FORMATS[ext][0]), ".wav")
+            self.filename = os.path.basename(self.filepath)
+            self.level_analyzer = LevelAnalyzer(self.engine.input_channels, self.engine.sample_format)
+            self.waveform_pyramid = MinMaxPyramid(self.engine.input_channels, self.engine.sample_format)
+            self.engine.chunk_listeners = [self.level_analyzer.process, self.waveform_pyramid.append]
+            try:
+                self.engine.start(self.filepath)
+            except OSError as e:
+                self.show_error_dialog(f"Could not create file:\n{e.strerror}")
+                return
+            except ValueError as e:
+                self.show_error_dialog(str(e))
+                return
+            self.record_button_label.invert_active_state()
+            self.gap_count = 0
+            self.waiting_for_sound = False
+            self.set_current_recording_text(recording=True)
+            self.total_time = 0.0
+            self.clock_timer.start()
+            self.level_meter.set_analyzer(self.level_analyzer)
+            self.waveform_view.set_pyramid(self.waveform_pyramid, self.engine.rate)
+            self.notify(f"Recording Started:\n{self.filename} created.", key=self.filename)
 
     def pause_recording(self):
-        """This function is called when User clicks the pause button. If paused, it will set
-        variables so that the currently running threads may resume again. Otherwise, it
-        pause the threads (again, by only setting the vars and letting the threads take
-        care of the rest).."""
+        """This function is called when User clicks the pause button. If paused, it resumes
+        the recording, otherwise it pauses it. Only the recorder state is changed here; the
+        currently running threads are woken up by the transition and take care of the rest.
+        If there is no recording to pause, the recorder state rejects it and an error
+        message is shown."""
+
+        try:
+            if self.engine.state.get_state() is RecorderState.PAUSED:
+                self.engine.resume()
+                self.set_current_recording_text(recording=True)
+            else:
+                self.engine.pause()
+                self.set_current_recording_text(paused=True)
+        except IllegalTransitionError as e:
+            self.show_error_dialog(str(e))
+            return
+        self.pause_button_label.invert_active_state()
+        self.record_button_label.invert_active_state()
 
-        if self.paused:
-            self.pause_button_label.invert_active_state()
-            self.recording = True
-            self.paused = False
+    def stop_recording(self):
+        """This function is called when you stop recording. The recorder state rejects
+        stopping when there is no recording underway, in which case an error message is
+        shown. Otherwise, the engine lets the recording thread finish, which closes the
+        writer and finalizes the .wav header. Since the audio has already been streamed to
+        disk, this returns almost immediately. Compressed files are then encoded in the
+        background. This function will also take care of resetting the variables for a new
+        recording to take place."""
+
+        filename = self.filename
+
+        def on_encode_progress(fraction: float):
+            if not self.engine.state.is_active():
+                self.ui_bridge.post("status", f"Encoding: {filename} {int(fraction * 100)}%")
+
+        def on_encode_done(path: str, error: Exception):
+            self.ui_bridge.post("encoded", (filename, error))
+
+        try:
+            previous_state = self.engine.stop(on_encode_progress, on_encode_done)
+        except IllegalTransitionError as e:
+            self.show_error_dialog(str(e))
+            return
+        if previous_state is RecorderState.RECORDING:
             self.record_button_label.invert_active_state()
-            self.set_current_recording_text(recording=True)
-        elif self.recording:
-            self.recording = False
-            self.paused = True
+        elif previous_state is RecorderState.PAUSED:
             self.pause_button_label.invert_active_state()
-            self.record_button_label.invert_active_state()
-            self.set_current_recording_text(paused=True)
-        else:
-            warning_dialog = FramelessDialog(self, "You must first start a\nrecording to be able to pause.",
-                                             self.normal_bg, self.highlight_bg, self.normal_color, self.highlight_color,
-                                             "Error", self.current_font)
-            self.main_frame_blur.setEnabled(True)
-            warning_dialog.exec_()
-            self.main_frame_blur.setEnabled(False)
-
-    def stop_recording(self):
-        """This function is called when you stop recording. It will check that you have a
-        recording that you have at least started already. Otherwise, it will save the recording
-        via wave, an in-built python module for wav files. This function will also take care of
-        resetting the variables for a new recording to take place."""
-
-        self.stopped = True
-        if not self.recording and not self.paused:
-            warning_dialog = FramelessDialog(self, "Please start recording first.", self.normal_bg, self.highlight_bg,
-                                             self.normal_color, self.highlight_color, "Error", self.current_font)
-            self.main_frame_blur.setEnabled(True)
-            warning_dialog.exec_()
-            self.main_frame_blur.setEnabled(False)
+        self.clock_timer.stop()
+        self.level_meter.set_analyzer(None)
+        self.waveform_view.set_pyramid(None)
+        self.engine.chunk_listeners = []
+        if needs_encoding(self.filepath):
+            self.set_current_recording_text(f"{filename} 0%", encoding=True)
         else:
-            if self.recording:
-                self.record_button_label.invert_active_state()
-            elif self.paused:
-                self.pause_button_label.invert_active_state()
-            self.recording = False
-            self.paused = False
-            with wave.open(self.filepath, "wb") as wf:
-                wf.setnchannels(self.input_channels)
-                wf.setsampwidth(self.p.get_sample_size(SAMPLE_FORMAT))
-                wf.setframerate(FPS)
-                wf.writeframes(b''.join(self.frames))
-                self.frames.clear()
-            self.toaster.show_toast(self.app_name, f"Recording Stopped:\n{self.filename} saved.",
-                                    resource_path("images/icon.ico"), 3, True)
+            self.notify(f"Recording Stopped:\n{self.filename} saved.", key=self.filename)
             self.set_current_recording_text(stopped=True)
-            self.total_time = 0.0
-            self.filepath = ""
-            self.filename = ""
-            self.set_current_time_text(0)
-        for thread in self.threads:
-            if thread.is_alive():
-                thread.join(.5)
-        self.threads.clear()
+        self.total_time = 0.0
+        self.filepath = ""
+        self.filename = ""
+        self.set_current_time_text(0)
+
+    def on_encode_finished(self, result: (str, Exception)):
+        """Called on the GUI thread when an encode job is done."""
+
+        filename, error = result
+        if error is not None:
+            self.show_error_dialog(f"Could not encode {filename}:\n{error}")
+            return
+        if not self.engine.state.is_active():
+            self.set_current_recording_text(filename, stopped=True)
+        self.notify(f"Recording Stopped:\n{filename} saved.", key=filename)
 
     def settings(self):
-        """This function takes care of the settings dialog."""
+        """This function takes care of the settings dialog. If it is accepted, the engine is
+        configured with exactly the device, rate, channels and format that were picked, and
+        the rate and channels recordings are saved with, the capture buffer size, the
+        pre-roll, how recordings are split and what is done with silence."""
 
         self.settings_label.invert_active_state()
-        io_text = "Input:\n%s\nOutput:\n%s\n" % (self.input_device_name, self.output_device_name)
-        settings_dialog = FramelessDialog(self, io_text, self.normal_bg, self.highlight_bg,
-                                          self.normal_color, self.highlight_color, "Settings", self.current_font)
+        try:
+            self.engine.ensure_ready()
+        except OSError as e:
+            self.show_error_dialog("No audio devices available:\n%s" % e)
+            self.settings_label.invert_active_state()
+            return
+        settings_dialog = SettingsDialog(self, self.engine, self.normal_bg, self.highlight_bg, self.normal_color,
+                                         self.highlight_color, self.current_font)
         if self.always_on_top:
             settings_dialog.setWindowFlag(Qt.WindowStaysOnTopHint)
         self.main_frame_blur.setEnabled(True)
         result = settings_dialog.exec_()
-        if result == 0:
-            self.main_frame_blur.setEnabled(False)
-            self.settings_label.invert_active_state()
+        self.main_frame_blur.setEnabled(False)
+        self.settings_label.invert_active_state()
+        selection = settings_dialog.get_selection()
+        if result == QtWidgets.QDialog.Accepted and selection and not self.engine.state.is_active():
+            try:
+                # The input stream of the pre-roll is reopened once, after every setting is applied.
+                with self.engine.deferred_arming():
+                    self.engine.configure(*selection)
+                    self.engine.set_output_rate(settings_dialog.get_output_rate())
+                    self.engine.set_routing(*settings_dialog.get_routing())
+                    self.engine.set_buffer_size(*settings_dialog.get_buffer())
+                    self.engine.set_preroll(settings_dialog.get_preroll())
+                    self.engine.set_segmenting(settings_dialog.get_segment_policy())
+                    self.engine.set_voice_activity(settings_dialog.get_voice_activity(),
+                                                   self.engine.vad_threshold_db)
+            except ValueError as e:
+                self.show_error_dialog(str(e))
 
     def about(self):
         """This function takes care of the about dialog."""
@@ -559,29 +720,34 @@ class AudioRecorder(QMainWindow):
 
     def exit_app(self):
         """This function will take care of possible User error while exiting, as one can only
-        save a file by pressing stop. It will also close the PyAudio object, join all remaining
-        possible threads, and finally exit."""
-
-        if self.recording or self.paused:
-            warning_dialog = FramelessDialog(self, "You must press stop in\norder to save your recording.",
-                                             self.normal_bg, self.highlight_bg, self.normal_color, self.highlight_color,
-                                             "Error", self.current_font)
-            if self.recording:
-                warning_dialog.message_label.setText("Recording in progress.\nPlease press Stop.")
-            self.main_frame_blur.setEnabled(True)
-            warning_dialog.exec_()
-            self.main_frame_blur.setEnabled(False)
+        save a file by pressing stop. It will also close the engine, which waits for pending
+        encodes and closes the PyAudio object, deliver the notifications still queued, and
+        finally exit."""
+
+        if self.engine.state.get_state() is RecorderState.RECORDING:
+            self.show_error_dialog("Recording in progress.\nPlease press Stop.")
+            return
+        try:
+            self.engine.close()
+        except IllegalTransitionError as e:
+            self.show_error_dialog(str(e))
             return
-        self.p.terminate()
-        for thread in self.threads:
-            thread.join()
+        self.notifier.close()
         sys.exit(0)
 
 
 def main():
+    multiprocessing.freeze_support()
+    # Set AUDIORECORDER_LOG_LEVEL=INFO to see the startup timings.
+    logging.basicConfig(level=os.environ.get("AUDIORECORDER_LOG_LEVEL", "WARNING"))
+    startup_timer.mark("imports")
     app = QApplication(sys.argv)
+    # Icons are kept pre-scaled for the screen, so later startups skip decoding and scaling them.
+    pixmap_cache.set_cache_dir(PIXMAP_CACHE_DIR)
+    startup_timer.mark("qapplication")
     screen_size = app.primaryScreen().size()
     GUI = AudioRecorder(screen_size.width(), screen_size.height())
+    startup_timer.mark("window created")
     sys.exit(app.exec_())
 
 
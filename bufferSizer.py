@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the adaptive capture buffer sizing."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import time
+
+from captureHealth import CaptureHealth
+
+MIN_BUFFER_FRAMES = 256
+MAX_BUFFER_FRAMES = 8192
+# The buffer sizes offered to the user, in frames.
+BUFFER_SIZES = (256, 512, 1024, 2048, 4096, 8192)
+
+
+class AdaptiveBufferSizer:
+    """This class picks the capture buffer size from the capture health of the recording.
+
+    check() is called regularly by the recording thread. If the recording had overflows,
+    ring overruns or late reads since the last check, the buffer is doubled, trading
+    latency for robustness. After idle_seconds without any problem it is halved again,
+    down to min_frames. :returns of check() are (new size, reason) or None."""
+
+    def __init__(self, frames: int, min_frames: int = MIN_BUFFER_FRAMES, max_frames: int = MAX_BUFFER_FRAMES,
+                 check_interval: float = 1.0, idle_seconds: float = 30.0):
+        self.frames = frames
+        self.min_frames = min(min_frames, frames)
+        self.max_frames = max(max_frames, frames)
+        self.check_interval = check_interval
+        self.idle_seconds = idle_seconds
+        self.last_check = time.monotonic()
+        self.quiet_since = self.last_check
+        self.seen_problems = 0
+        self.seen_ring_dropped_frames = 0
+
+    def check(self, health: CaptureHealth) -> (int, str):
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return None
+        self.last_check = now
+        problems = health.overflows + health.late_reads
+        new_problems, self.seen_problems = problems - self.seen_problems, problems
+        # ring_dropped_frames counts frames, not events: any increase is one more overrun.
+        if health.ring_dropped_frames > self.seen_ring_dropped_frames:
+            new_problems += 1
+        self.seen_ring_dropped_frames = health.ring_dropped_frames
+        if new_problems:
+            self.quiet_since = now
+            if self.frames < self.max_frames:
+                self.frames *= 2
+                return self.frames, "%d overflows, late reads or ring overruns" % new_problems
+        elif now - self.quiet_since >= self.idle_seconds and self.frames > self.min_frames:
+            self.quiet_since = now
+            self.frames //= 2
+            return self.frames, "idle for %d s" % self.idle_seconds
+        return None
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the callback-driven capture engine. PortAudio calls the capture
+callback from its own thread, and the callback only copies each chunk into a ring buffer
+that the consumers drain."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import pyaudio
+
+from captureHealth import CaptureHealth
+from ringBuffer import RingBuffer, RingReader
+
+
+class CallbackCapture:
+    """This class captures audio using PyAudio's stream_callback mode.
+
+    The callback runs on PortAudio's thread and does as little as possible: it copies
+    the chunk into a preallocated RingBuffer and counts the frames delivered. There is no
+    Python loop in the real-time path, so a busy interpreter does not cause input
+    overflows as easily as blocking reads do.
+
+    Any number of consumers can call add_reader() and drain the same capture
+    independently. ring_seconds is how much audio the ring holds before a slow consumer
+    is overrun.
+
+    If a CaptureHealth is given, the callback reports input overflows and the interval
+    between callbacks to it."""
+
+    def __init__(self, p: pyaudio.PyAudio, channels: int, rate: int, sample_format: int,
+                 frames_per_buffer: int = 1024, input_device_index: int = None, ring_seconds: float = 2.0,
+                 health: CaptureHealth = None):
+        self.p = p
+        self.channels = channels
+        self.rate = rate
+        self.sample_format = sample_format
+        self.frames_per_buffer = frames_per_buffer
+        self.input_device_index = input_device_index
+        self.sample_width = p.get_sample_size(sample_format)
+        self.block_align = self.channels * self.sample_width
+        self.ring = RingBuffer(int(ring_seconds * rate) * self.block_align, self.block_align)
+        self.frames_captured = 0
+        self.health = health
+        self.stream = None
+
+    def open(self):
+        """Opens the stream without starting it."""
+
+        self.stream = self.p.open(format=self.sample_format, channels=self.channels, rate=self.rate,
+                                  frames_per_buffer=self.frames_per_buffer, input=True,
+                                  input_device_index=self.input_device_index, start=False,
+                                  stream_callback=self._callback)
+
+    def start(self):
+        if self.stream is None:
+            self.open()
+        if not self.stream.is_active():
+            self.stream.start_stream()
+
+    def stop(self):
+        if self.stream is not None and not self.stream.is_stopped():
+            self.stream.stop_stream()
+        if self.health is not None:
+            self.health.reset_callback_interval()
+
+    def close(self):
+        if self.stream is not None:
+            self.stop()
+            self.stream.close()
+            self.stream = None
+
+    def reopen(self, frames_per_buffer: int):
+        """Reopens the stream with a different host buffer size, keeping the ring buffer and
+        its readers. Audio is lost while the stream is reopened."""
+
+        was_active = self.is_active()
+        self.close()
+        self.frames_per_buffer = frames_per_buffer
+        self.open()
+        if was_active:
+            self.start()
+
+    def is_active(self) -> bool:
+        return self.stream is not None and self.stream.is_active()
+
+    def add_reader(self, preroll: float = 0.0) -> RingReader:
+        """:returns a new reader, starting preroll seconds back in what was already captured
+        (as far as the ring still holds it)."""
+
+        start_pos = self.ring.write_pos - int(preroll * self.rate) * self.block_align
+        return self.ring.add_reader(max(start_pos, 0))
+
+    def _callback(self, in_data, frame_count, time_info, status_flags):
+        """PortAudio's thread runs this function for every captured buffer."""
+
+        self.ring.write(in_data)
+        self.frames_captured += frame_count
+        if self.health is not None:
+            self.health.add_callback()
+            if status_flags & pyaudio.paInputOverflow:
+                self.health.add_overflow()
+        return None, pyaudio.paContinue
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the capture health counters kept for every recording."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import bisect
+import json
+import time
+
+# The upper bounds of the latency histogram buckets, in milliseconds. The last bucket is open ended.
+LATENCY_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# A read or callback is late when it comes this many buffer durations after the previous one.
+LATE_FACTOR = 2.0
+
+
+class LatencyHistogram:
+    """This class counts durations into the buckets of LATENCY_BOUNDS_MS, and keeps their
+    maximum and mean."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds: float):
+        milliseconds = seconds * 1000
+        self.counts[bisect.bisect_left(LATENCY_BOUNDS_MS, milliseconds)] += 1
+        self.total += milliseconds
+        self.maximum = max(self.maximum, milliseconds)
+
+    def to_dict(self) -> dict:
+        count = sum(self.counts)
+        return {
+            "bounds_ms": list(LATENCY_BOUNDS_MS),
+            "counts": list(self.counts),
+            "mean_ms": round(self.total / count, 3) if count else None,
+            "max_ms": round(self.maximum, 3),
+        }
+
+
+class CaptureHealth:
+    """This class counts what can go wrong while a recording is captured, so that a take
+    can be shown to have no gaps:
+
+    overflows: input overflows reported by PortAudio (status flags in callback mode, the
+    paInputOverflowed error in blocking mode).
+    dropped_frames: frames that never reached the file, because PortAudio discarded a
+    blocking read that overflowed, or because the ring buffer overran its reader.
+    buffer_fill: how full the ring buffer was each time it was drained (callback mode).
+    read_latency: the duration of each blocking read, or the interval between callbacks.
+    late_reads: reads or callbacks that came more than LATE_FACTOR buffers after the
+    previous one.
+    queue_depth: how many chunks were waiting in the writer's queue at each write.
+    buffer_changes: the buffer sizes the recording switched to, and why.
+    resume_latency: the time from each resume() to the first sample written after it.
+
+    Each counter is only updated by one thread (PortAudio's or the recording thread), so
+    no lock is taken in the real-time path. snapshot() may be called from any thread; it
+    can be a chunk out of date, but never blocks the capture."""
+
+    def __init__(self, capture_mode: str, rate: int, chunk: int):
+        self.capture_mode = capture_mode
+        self.rate = rate
+        self.chunk = chunk
+        self.started = time.time()
+        self.overflows = 0
+        self.dropped_frames = 0
+        self.ring_dropped_frames = 0
+        self.buffer_fill_max = 0.0
+        self.buffer_fill_last = 0.0
+        self.queue_depth_max = 0
+        self.queue_depth_total = 0
+        self.writes = 0
+        self.read_latency = LatencyHistogram()
+        self.late_reads = 0
+        self.late_threshold = LATE_FACTOR * chunk / rate
+        self.buffer_changes = []
+        self.resume_latency = LatencyHistogram()
+        self.last_callback_time = None
+
+    def add_overflow(self, dropped_frames: int = 0):
+        self.overflows += 1
+        self.dropped_frames += dropped_frames
+
+    def add_read(self, seconds: float):
+        self.read_latency.add(seconds)
+
+    def add_interval(self, seconds: float):
+        """Records the time between two reads, counting it as late if it is too long."""
+
+        if seconds > self.late_threshold:
+            self.late_reads += 1
+
+    def add_callback(self):
+        """Called by the capture callback; records the interval since the previous one."""
+
+        now = time.perf_counter()
+        if self.last_callback_time is not None:
+            self.read_latency.add(now - self.last_callback_time)
+            self.add_interval(now - self.last_callback_time)
+        self.last_callback_time = now
+
+    def add_resume(self, seconds: float):
+        self.resume_latency.add(seconds)
+
+    def set_chunk(self, chunk: int, reason: str):
+        """Records a change of buffer size."""
+
+        self.chunk = chunk
+        self.late_threshold = LATE_FACTOR * chunk / self.rate
+        self.buffer_changes.append({"time": round(time.time() - self.started, 3), "chunk": chunk, "reason": reason})
+
+    def reset_callback_interval(self):
+        """Called when the stream stops, so a pause is not counted as a late callback."""
+
+        self.last_callback_time = None
+
+    def set_ring_dropped_frames(self, frames: int):
+        self.ring_dropped_frames = frames
+
+    def add_buffer_fill(self, fraction: float):
+        self.buffer_fill_last = fraction
+        self.buffer_fill_max = max(self.buffer_fill_max, fraction)
+
+    def add_queue_depth(self, depth: int):
+        self.queue_depth_max = max(self.queue_depth_max, depth)
+        self.queue_depth_total += depth
+        self.writes += 1
+
+    def get_gap_count(self) -> int:
+        """:returns how many times audio may have been lost, 0 for a clean take."""
+
+        return self.overflows + (1 if self.ring_dropped_frames else 0)
+
+    def snapshot(self) -> dict:
+        return {
+            "capture_mode": self.capture_mode,
+            "rate": self.rate,
+            "chunk": self.chunk,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "overflows": self.overflows,
+            "dropped_frames": self.dropped_frames + self.ring_dropped_frames,
+            "buffer_fill": {"max": round(self.buffer_fill_max, 4), "last": round(self.buffer_fill_last, 4)},
+            "read_latency": self.read_latency.to_dict(),
+            "late_reads": self.late_reads,
+            "writer_queue_depth": {
+                "max": self.queue_depth_max,
+                "mean": round(self.queue_depth_total / self.writes, 3) if self.writes else None,
+            },
+            "buffer_changes": list(self.buffer_changes),
+            "resume_latency": self.resume_latency.to_dict(),
+        }
+
+    def write_sidecar(self, path: str, extra: dict = None):
+        """Writes the snapshot, with the entries of extra added, to path as JSON."""
+
+        report = self.snapshot()
+        report.update(extra or {})
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
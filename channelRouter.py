@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the channel routing stage, used to write fewer channels than the
+input device captures."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import numpy as np
+
+
+def get_mono_matrix(channels: int) -> np.ndarray:
+    """:returns the mixing matrix that averages channels into one."""
+
+    return np.full((channels, 1), 1 / channels, dtype=np.float32)
+
+
+def parse_channels(text: str) -> [int]:
+    """Parses a comma separated list of channels counted from 1 (e.g. "3,4"), and
+    :returns them counted from 0."""
+
+    try:
+        channels = [int(channel) - 1 for channel in text.split(",")]
+    except ValueError:
+        raise ValueError("%r is not a list of channels." % text) from None
+    if min(channels) < 0:
+        raise ValueError("Channels are counted from 1.")
+    return channels
+
+
+class ChannelRouter:
+    """This class is a ProcessingChain stage that picks a subset of the input channels
+    and optionally mixes them with a matrix, shape (selected channels, output channels).
+
+    Both are done on the whole chunk at once: the selection is a single fancy index on
+    the (frames, channels) block, and the mix a single matrix product, so a stereo to
+    mono downmix of a 16 channel interface costs two numpy calls per chunk."""
+
+    def __init__(self, input_channels: int, channels: [int] = None, matrix: np.ndarray = None):
+        self.input_channels = input_channels
+        self.channels = list(range(input_channels)) if channels is None else list(channels)
+        if not self.channels or max(self.channels) >= input_channels:
+            raise ValueError("Pick channels between 1 and %d." % input_channels)
+        self.matrix = None if matrix is None else np.asarray(matrix, dtype=np.float32)
+        if self.matrix is not None and self.matrix.shape[0] != len(self.channels):
+            raise ValueError("The mixing matrix needs one row for each of the %d channels." % len(self.channels))
+        self.output_channels = len(self.channels) if self.matrix is None else self.matrix.shape[1]
+        self.select_all = self.channels == list(range(input_channels))
+
+    def is_identity(self) -> bool:
+        """:returns True if the router would return its input unchanged."""
+
+        return self.select_all and self.matrix is None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if not self.select_all:
+            block = block[:, self.channels]
+        if self.matrix is not None:
+            block = block @ self.matrix
+        return block
+
+    def flush(self) -> np.ndarray:
+        return np.zeros((0, self.output_channels), dtype=np.float32)
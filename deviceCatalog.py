@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the catalog of input devices and the configurations they support."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import threading
+
+import pyaudio
+
+COMMON_RATES = (8000, 11025, 16000, 22050, 32000, 44100, 48000, 88200, 96000, 176400, 192000)
+# PortAudio sample format: the name shown to the user.
+SAMPLE_FORMAT_NAMES = {
+    pyaudio.paInt16: "16-bit",
+    pyaudio.paInt24: "24-bit",
+    pyaudio.paInt32: "32-bit",
+    pyaudio.paFloat32: "32-bit float",
+}
+
+
+class InputDevice:
+    """This class describes an input device and the configurations it supports. The
+    supported rates, formats and channel counts are probed with is_format_supported();
+    each of them is probed with the other two set to the device's defaults."""
+
+    def __init__(self, info: dict, host_api_name: str):
+        self.index = info['index']
+        self.name = info['name']
+        self.host_api_name = host_api_name
+        self.max_input_channels = info['maxInputChannels']
+        self.default_rate = int(info['defaultSampleRate'])
+        self.rates = []
+        self.sample_formats = []
+        self.channel_counts = []
+
+    def get_display_name(self) -> str:
+        return "%s (%s)" % (self.name, self.host_api_name)
+
+    def probe(self, p: pyaudio.PyAudio):
+        self.rates = [rate for rate in sorted(set(COMMON_RATES + (self.default_rate,)))
+                      if self.is_supported(p, rate, self.max_input_channels, pyaudio.paInt16)]
+        self.sample_formats = [sample_format for sample_format in SAMPLE_FORMAT_NAMES
+                               if self.is_supported(p, self.default_rate, self.max_input_channels, sample_format)]
+        self.channel_counts = [channels for channels in range(1, self.max_input_channels + 1)
+                               if self.is_supported(p, self.default_rate, channels, pyaudio.paInt16)]
+
+    def is_supported(self, p: pyaudio.PyAudio, rate: int, channels: int, sample_format: int) -> bool:
+        """Checks one exact configuration with PortAudio."""
+
+        try:
+            return bool(p.is_format_supported(rate, input_device=self.index, input_channels=channels,
+                                              input_format=sample_format))
+        except ValueError:
+            return False
+
+
+class DeviceCatalog:
+    """This class enumerates every input device of every host API once, probes what each
+    one supports, and caches the results. PortAudio only sees devices that were present
+    when it was initialized, so after a device is plugged in or removed the engine creates
+    a new PyAudio object and calls refresh() with it."""
+
+    def __init__(self, p: pyaudio.PyAudio):
+        self.p = p
+        self.devices = None
+        self.lock = threading.Lock()
+
+    def get_input_devices(self) -> [InputDevice]:
+        """:returns all the input devices, enumerating and probing them on the first call."""
+
+        with self.lock:
+            if self.devices is None:
+                self.devices = self._enumerate()
+            return self.devices
+
+    def get_device(self, index: int) -> InputDevice:
+        """:returns the device with the given PortAudio index, or None."""
+
+        return next((device for device in self.get_input_devices() if device.index == index), None)
+
+    def refresh(self, p: pyaudio.PyAudio = None):
+        """Drops the cached results, so the devices are enumerated again on the next call."""
+
+        with self.lock:
+            if p is not None:
+                self.p = p
+            self.devices = None
+
+    def _enumerate(self) -> [InputDevice]:
+        devices = []
+        for host_api_index in range(self.p.get_host_api_count()):
+            host_api = self.p.get_host_api_info_by_index(host_api_index)
+            for device_number in range(host_api['deviceCount']):
+                info = self.p.get_device_info_by_host_api_device_index(host_api_index, device_number)
+                if info['maxInputChannels'] > 0:
+                    device = InputDevice(info, host_api['name'])
+                    device.probe(self.p)
+                    devices.append(device)
+        return devices
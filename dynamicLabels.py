@@ -17,6 +17,9 @@ import sys
 from PyQt5 import QtGui, QtWidgets, QtCore
 from PyQt5.QtCore import Qt
 
+from pixmapCache import pixmap_cache
+from theme import Theme, get_rgb_string, get_theme
+
 
 class ColorChangingLabel(QtWidgets.QLabel):
     """This is a class for creating labels that will change color, based on mouse location.
@@ -24,34 +27,50 @@ class ColorChangingLabel(QtWidgets.QLabel):
     If the mouse is hovering over, the label changes color to highlight_color and highlight_bg.
     Otherwise the label resorts to the colors normal_color and normal_bg.
 
+    The colors come from a shared Theme, which has a QPalette for each look. Hovering only
+    swaps the palette, so Qt never has to parse a stylesheet or repolish the label.
+
     A few extra helper functions are also defined in this class, such as:
     get_rgb_string()
-    get_style_sheet()
-    set_all_colors() {for changing the colors of a label on the fly.}"""
+    get_palette()
+    set_all_colors() and set_theme() {for changing the colors of a label on the fly.}"""
 
     def __init__(self, normal_bg: QtGui.QColor = None, highlight_bg: QtGui.QColor = None,
                  normal_color: QtGui.QColor = None, highlight_color: QtGui.QColor = None, highlightable: bool = True):
         super(ColorChangingLabel, self).__init__()
-        self.normal_bg = normal_bg
-        self.highlight_bg = highlight_bg
-        self.normal_color = normal_color
-        self.highlight_color = highlight_color
         self.highlightable = highlightable
-        self.setStyleSheet("""
-        QLabel{
-        color: rgba(187, 172, 193, 255);
-        }""")
+        self.theme = None
+        self.highlighted = False
+        if None in (normal_bg, highlight_bg, normal_color, highlight_color):
+            self.normal_bg = normal_bg
+            self.highlight_bg = highlight_bg
+            self.normal_color = normal_color
+            self.highlight_color = highlight_color
+            self.setStyleSheet("""
+            QLabel{
+            color: rgba(187, 172, 193, 255);
+            }""")
+        else:
+            self.set_all_colors(normal_bg, highlight_bg, normal_color, highlight_color)
 
     def enterEvent(self, a0: QtCore.QEvent) -> None:
         if self.highlightable:
-            self.setStyleSheet(self.get_style_sheet(True))
+            self.set_highlighted(True)
         super(ColorChangingLabel, self).enterEvent(a0)
 
     def leaveEvent(self, a0: QtCore.QEvent) -> None:
         if self.highlightable:
-            self.setStyleSheet(self.get_style_sheet(False))
+            self.set_highlighted(False)
         super(ColorChangingLabel, self).leaveEvent(a0)
 
+    def set_highlighted(self, highlighted: bool):
+        """Switches the label between its normal and highlighted palettes."""
+
+        if self.theme is None or self.highlighted == highlighted:
+            return
+        self.highlighted = highlighted
+        self.setPalette(self.get_palette(highlighted))
+
     def get_rgb_string(self, idx: int = 0) -> str:
         """Returns the RGB portion of the string to be used in the styleSheet.
         idx = 0 means normal bg
@@ -59,51 +78,34 @@ class ColorChangingLabel(QtWidgets.QLabel):
         2 == normal color
         3 == highlight color"""
 
-        if idx == 0:
-            color = QtGui.QColor(self.normal_bg)
-        elif idx == 1:
-            color = QtGui.QColor(self.highlight_bg)
-        elif idx == 2:
-            color = QtGui.QColor(self.normal_color)
-        elif idx == 3:
-            color = QtGui.QColor(self.highlight_color)
-        else:
+        colors = (self.normal_bg, self.highlight_bg, self.normal_color, self.highlight_color)
+        if idx not in range(len(colors)):
             return "Error. Wrong idx value in get_rgb_string"
+        return get_rgb_string(colors[idx])
 
-        red = str(color.red())
-        green = str(color.green())
-        blue = str(color.blue())
-
-        return "".join([red, ", ", green, ", ", blue])
-
-    def get_style_sheet(self, highlighted: bool = False):
-        """:returns the stylesheet for a label based on if it is highlighted or not."""
-
-        normal_bg_rgb = self.get_rgb_string(0)
-        highlight_bg_rgb = self.get_rgb_string(1)
-        normal_color_rgb = self.get_rgb_string(2)
-        highlight_color_rgb = self.get_rgb_string(3)
-
-        if highlighted:
-            styleSheet = """
-            QLabel {
-            color: rgba(%s, 255);
-            background-color: rgba(%s, 255);
-            }""" % (highlight_color_rgb, highlight_bg_rgb)
-            return styleSheet
-        elif not highlighted:
-            styleSheet = """
-            QLabel {
-            color: rgba(%s, 255);
-            background-color: rgba(%s, 255);
-            }""" % (normal_color_rgb, normal_bg_rgb)
-            return styleSheet
+    def get_palette(self, highlighted: bool = False) -> QtGui.QPalette:
+        """:returns the palette for the label based on if it is highlighted or not."""
+
+        return self.theme.highlight_palette if highlighted else self.theme.normal_palette
 
     def set_all_colors(self, normal_bg, highlight_bg, normal_color, highlight_color):
-        self.normal_bg = normal_bg
-        self.highlight_bg = highlight_bg
-        self.normal_color = normal_color
-        self.highlight_color = highlight_color
+        self.set_theme(get_theme(normal_bg, highlight_bg, normal_color, highlight_color))
+
+    def set_theme(self, theme: Theme):
+        """Changes the label's colors to those of theme."""
+
+        self.normal_bg = theme.normal_bg
+        self.highlight_bg = theme.highlight_bg
+        self.normal_color = theme.normal_color
+        self.highlight_color = theme.highlight_color
+        if theme is self.theme:
+            return
+        if self.theme is None:
+            # Drop the default stylesheet; from now on the palette does all the styling.
+            self.setStyleSheet("")
+            self.setAutoFillBackground(True)
+        self.theme = theme
+        self.setPalette(self.get_palette(self.highlighted))
 
 
 class ImageChangingLabel(QtWidgets.QLabel):
@@ -116,6 +118,9 @@ class ImageChangingLabel(QtWidgets.QLabel):
     Otherwise, the ' 'normal' ' image is image_1.
 
     The images can be resized. The images parameters are the filepaths to the images.
+    They are loaded through the shared pixmap_cache, for the device pixel ratio of the
+    label's screen, so every label showing the same image at the same size shares one
+    pixmap, and the highlighted image is only loaded when it is first shown.
 
     A useful helper function to call is invert_active_state() which will turn the label into
     its highlighted version until called again. This is great for showing that a label has
@@ -128,18 +133,20 @@ class ImageChangingLabel(QtWidgets.QLabel):
         self.active = False
 
         self.func = func
-        self.img_1_pixmap = QtGui.QPixmap(image_1).scaled(resized_x, resized_y, Qt.KeepAspectRatio)
-        self.img_2_pixmap = QtGui.QPixmap(image_2).scaled(resized_x, resized_y, Qt.KeepAspectRatio)
-        self.setPixmap(self.img_1_pixmap)
+        self.image_1 = image_1
+        self.image_2 = image_2
+        self.resized_x = resized_x
+        self.resized_y = resized_y
+        self.setPixmap(self.get_pixmap(False))
 
     def enterEvent(self, a0: QtCore.QEvent) -> None:
         if not self.active:
-            self.setPixmap(self.img_2_pixmap)
+            self.setPixmap(self.get_pixmap(True))
         super(ImageChangingLabel, self).enterEvent(a0)
 
     def leaveEvent(self, a0: QtCore.QEvent) -> None:
         if not self.active:
-            self.setPixmap(self.img_1_pixmap)
+            self.setPixmap(self.get_pixmap(False))
         super(ImageChangingLabel, self).leaveEvent(a0)
 
     def mousePressEvent(self, ev: QtGui.QMouseEvent) -> None:
@@ -155,12 +162,15 @@ class ImageChangingLabel(QtWidgets.QLabel):
         super(ImageChangingLabel, self).mouseReleaseEvent(ev)
 
     def update(self) -> None:
-        if self.active:
-            self.setPixmap(self.img_2_pixmap)
-        else:
-            self.setPixmap(self.img_1_pixmap)
+        self.setPixmap(self.get_pixmap(self.active))
         super(ImageChangingLabel, self).update()
 
+    def get_pixmap(self, highlighted: bool = False) -> QtGui.QPixmap:
+        """:returns the highlighted or the normal image, scaled for the label's screen."""
+
+        return pixmap_cache.get(self.image_2 if highlighted else self.image_1, self.resized_x, self.resized_y,
+                                self.devicePixelRatioF())
+
     def invert_active_state(self):
         self.active = (not self.active)
         self.update()
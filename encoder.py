@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the background encoder that turns finished .wav recordings into
+compressed formats (FLAC, Ogg Vorbis) in a separate process."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# extension: (file dialog filter, soundfile format, soundfile subtype or None to match the source)
+FORMATS = {
+    ".wav": ("WAV Audio (*.wav)", None, None),
+    ".flac": ("FLAC Audio (*.flac)", "FLAC", None),
+    ".ogg": ("Ogg Vorbis Audio (*.ogg)", "OGG", "VORBIS"),
+}
+BLOCK_FRAMES = 65536
+
+# Set in each worker process by _init_worker.
+_progress_queue = None
+
+
+def get_available_formats() -> [str]:
+    """:returns the extensions that can be recorded to. .wav is always available, the
+    compressed formats need the optional soundfile module (and a libsndfile that supports
+    them)."""
+
+    try:
+        import soundfile
+    except (ImportError, OSError):
+        return [".wav"]
+    supported = soundfile.available_formats()
+    return [ext for ext, (_, file_format, _) in FORMATS.items() if file_format is None or file_format in supported]
+
+
+def get_file_dialog_filter(extensions: [str]) -> str:
+    return ";;".join(FORMATS[ext][0] for ext in extensions)
+
+
+def needs_encoding(filepath: str) -> bool:
+    return os.path.splitext(filepath)[1].lower() not in ("", ".wav")
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def encode_file(job_id: int, source_path: str, target_path: str, delete_source: bool) -> str:
+    """Worker processes run this function. Reads source_path block by block, writes it to
+    target_path in the format given by its extension, and reports progress as
+    (job_id, fraction done) on the progress queue. :returns target_path."""
+
+    import soundfile
+
+    _, file_format, subtype = FORMATS[os.path.splitext(target_path)[1].lower()]
+    info = soundfile.info(source_path)
+    if subtype is None:
+        subtype = info.subtype if info.subtype in ("PCM_16", "PCM_24") else "PCM_24"
+    dtype = "int16" if subtype == "PCM_16" else "int32"
+    if file_format == "OGG":
+        dtype = "float32"
+    frames_done = 0
+    with soundfile.SoundFile(target_path, "w", info.samplerate, info.channels, subtype, format=file_format) as out:
+        for block in soundfile.blocks(source_path, blocksize=BLOCK_FRAMES, dtype=dtype, always_2d=True):
+            out.write(block)
+            frames_done += len(block)
+            _progress_queue.put((job_id, frames_done / max(info.frames, 1)))
+    if delete_source:
+        os.remove(source_path)
+    return target_path
+
+
+class EncoderPool:
+    """This class runs encode jobs in a pool of worker processes, so encoding never
+    competes with the capture thread for the GIL.
+
+    The pool is started on the first submit(). Progress is reported through on_progress
+    (with the fraction done) and completion through on_done (with the target path and
+    the exception, or None). Both callbacks are called from a background thread of this
+    process, never from the GUI thread."""
+
+    def __init__(self, max_workers: int = 1):
+        self.max_workers = max_workers
+        self.executor = None
+        self.progress_queue = None
+        self.progress_thread = None
+        self.progress_callbacks = {}
+        self.job_ids = itertools.count()
+
+    def submit(self, source_path: str, target_path: str, on_progress=None, on_done=None,
+               delete_source: bool = True):
+        if self.executor is None:
+            self._start()
+        job_id = next(self.job_ids)
+        if on_progress is not None:
+            self.progress_callbacks[job_id] = on_progress
+        future = self.executor.submit(encode_file, job_id, source_path, target_path, delete_source)
+
+        def done(finished_future):
+            self.progress_callbacks.pop(job_id, None)
+            if on_done is not None:
+                on_done(target_path, finished_future.exception())
+
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        """Shuts the pool down. With wait, pending jobs are finished first."""
+
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=wait)
+        self.progress_queue.put(None)
+        self.progress_thread.join()
+        self.executor = None
+
+    def _start(self):
+        self.progress_queue = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(self.max_workers, initializer=_init_worker,
+                                            initargs=(self.progress_queue,))
+        self.progress_thread = threading.Thread(target=self._dispatch_progress)
+        self.progress_thread.setDaemon(True)
+        self.progress_thread.setName("Encoder Progress Thread")
+        self.progress_thread.start()
+
+    def _dispatch_progress(self):
+        """The progress thread runs this function. A None item means the pool was shut down."""
+
+        while True:
+            item = self.progress_queue.get()
+            if item is None:
+                return
+            job_id, fraction = item
+            callback = self.progress_callbacks.get(job_id)
+            if callback is not None:
+                callback(fraction)
@@ -16,6 +16,7 @@ from PyQt5.QtWidgets import QMainWindow
 from PyQt5.QtCore import Qt
 
 from dynamicLabels import ColorChangingLabel, CustomButton
+from theme import get_theme
 
 
 class FramelessDialog(QtWidgets.QDialog):
@@ -27,7 +28,9 @@ class FramelessDialog(QtWidgets.QDialog):
     a message in the middle dialog. This dialog will open DEAD CENTER in the QMainWindow
     that calls it.
     This class comes with one button only, ' 'ok' '. Other buttons can be added after creation.
-    This class can be dragged around via the window frame, similar to the QMainWindow."""
+    This class can be dragged around via the window frame, similar to the QMainWindow.
+    Its stylesheets come from the shared Theme of its colors, so they are only formatted
+    once however many dialogs are opened."""
 
     def __init__(self, master: QMainWindow = None, message: str = "", normal_bg: QtGui.QColor = None,
                  highlight_bg: QtGui.QColor = None, normal_color: QtGui.QColor = None,
@@ -37,10 +40,7 @@ class FramelessDialog(QtWidgets.QDialog):
 
         self.master = master
         self.message = message
-        self.normal_bg = normal_bg
-        self.highlight_bg = highlight_bg
-        self.normal_color = normal_color
-        self.highlight_color = highlight_color
+        self.set_all_colors(normal_bg, highlight_bg, normal_color, highlight_color)
         self.window_title = window_title
         self.current_font = current_font
         self.mousePressPos = None
@@ -151,25 +151,14 @@ class FramelessDialog(QtWidgets.QDialog):
         self.highlight_bg = highlight_bg
         self.normal_color = normal_color
         self.highlight_color = highlight_color
+        self.theme = get_theme(normal_bg, highlight_bg, normal_color, highlight_color)
 
     def get_style_sheet(self, for_frame: bool = False, for_dialog: bool = False) -> str:
-        red = str(self.normal_bg.red())
-        green = str(self.normal_bg.green())
-        blue = str(self.normal_bg.blue())
-        rgb_portion = "".join([red, ", ", green, ", ", blue])
-        styleSheet = ""
-        if for_frame:
-            styleSheet = """
-            QFrame{
-            background-color: rgba(%s,255);
-            }""" % rgb_portion
         if for_dialog:
-            styleSheet = """
-                        QDialog{
-                        background-color: rgba(%s,255);
-                        border: 1px solid white;
-                        }""" % rgb_portion
-        return styleSheet
+            return self.theme.dialog_style_sheet
+        if for_frame:
+            return self.theme.frame_style_sheet
+        return ""
 
     def exit_window(self):
         self.close()
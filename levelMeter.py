@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the input level analysis and the level meter widget."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import threading
+import time
+
+import numpy as np
+import pyaudio
+from PyQt5 import QtGui, QtWidgets, QtCore
+
+from sampleFormats import get_sample_format
+
+MIN_DB = -60.0
+
+
+class LevelAnalyzer:
+    """This class computes per-channel peak, RMS and clip counts of captured chunks.
+
+    process() is called by the recording thread with the raw interleaved chunk, in the
+    given PortAudio sample format. The chunk is decoded by its SampleFormat (a view in
+    place, except for packed 24-bit samples) and reduced per channel. The
+    results are accumulated until take() is called, so a reader that polls at a lower
+    rate than the audio never misses a peak or a clip."""
+
+    def __init__(self, channels: int, sample_format: int = pyaudio.paInt16):
+        self.channels = channels
+        self.sample_format = get_sample_format(sample_format)
+        self.full_scale = self.sample_format.full_scale
+        self.lock = threading.Lock()
+        self._reset()
+
+    def process(self, data: bytes):
+        block = self.sample_format.decode(data).reshape(-1, self.channels)
+        if not len(block):
+            return
+        # The int16 minimum has no positive counterpart, so take the extremes separately.
+        peak = np.maximum(block.max(axis=0).astype(np.float32), -block.min(axis=0).astype(np.float32))
+        clips = np.count_nonzero(block >= self.sample_format.max_value, axis=0) + \
+            np.count_nonzero(block <= self.sample_format.min_value, axis=0)
+        samples = block.astype(np.float32)
+        sum_squares = np.einsum("ij,ij->j", samples, samples)
+        with self.lock:
+            np.maximum(self.peak, peak / self.full_scale, out=self.peak)
+            self.sum_squares += sum_squares
+            self.frames += len(block)
+            self.clips += clips
+
+    def take(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        """:returns (peak, rms, clips) per channel since the last call, and resets them.
+        peak and rms are linear, with 1.0 being full scale."""
+
+        with self.lock:
+            peak, sum_squares, frames, clips = self.peak, self.sum_squares, self.frames, self.clips
+            self._reset()
+        rms = np.sqrt(sum_squares / max(frames, 1)) / self.full_scale
+        return peak, rms, clips
+
+    def _reset(self):
+        self.peak = np.zeros(self.channels, dtype=np.float32)
+        self.sum_squares = np.zeros(self.channels, dtype=np.float32)
+        self.frames = 0
+        self.clips = np.zeros(self.channels, dtype=np.int64)
+
+
+class LevelMeter(QtWidgets.QWidget):
+    """This class draws one horizontal bar per channel, showing the RMS level with the
+    peak level on top of it, a peak hold marker, and a clip indicator.
+
+    The meter polls a LevelAnalyzer from its own QTimer (refresh_rate times a second), so
+    painting is decoupled from the audio rate. Levels rise instantly, fall by decay_rate
+    dB per second, and the peak hold marker stays for hold_time seconds."""
+
+    def __init__(self, normal_bg: QtGui.QColor = None, normal_color: QtGui.QColor = None,
+                 highlight_bg: QtGui.QColor = None, refresh_rate: int = 30, decay_rate: float = 24.0,
+                 hold_time: float = 1.5):
+        super(LevelMeter, self).__init__()
+        self.normal_bg = normal_bg
+        self.normal_color = normal_color
+        self.highlight_bg = highlight_bg
+        self.clip_color = QtGui.QColor(220, 60, 60)
+        self.decay_rate = decay_rate
+        self.hold_time = hold_time
+        self.analyzer = None
+        self.last_update = time.time()
+        self.set_channels(0)
+
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setInterval(int(1000 / refresh_rate))
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def set_analyzer(self, analyzer: LevelAnalyzer):
+        """Starts polling analyzer. Passing None stops the meter and clears it."""
+
+        self.analyzer = analyzer
+        if analyzer is None:
+            self.refresh_timer.stop()
+            self.set_channels(self.channels)
+            self.update()
+        else:
+            self.set_channels(analyzer.channels)
+            self.last_update = time.time()
+            self.refresh_timer.start()
+
+    def set_channels(self, channels: int):
+        self.channels = channels
+        self.peak_db = np.full(channels, MIN_DB, dtype=np.float32)
+        self.rms_db = np.full(channels, MIN_DB, dtype=np.float32)
+        self.hold_db = np.full(channels, MIN_DB, dtype=np.float32)
+        self.hold_until = np.zeros(channels)
+        self.clip_until = np.zeros(channels)
+
+    def refresh(self):
+        """Called by the refresh timer. Applies the new levels with decay and hold, then
+        schedules a repaint."""
+
+        peak, rms, clips = self.analyzer.take()
+        now = time.time()
+        fall = self.decay_rate * (now - self.last_update)
+        self.last_update = now
+        with np.errstate(divide="ignore"):
+            new_peak_db = np.maximum(20 * np.log10(peak), MIN_DB)
+            new_rms_db = np.maximum(20 * np.log10(rms), MIN_DB)
+        self.peak_db = np.maximum(new_peak_db, self.peak_db - fall)
+        self.rms_db = np.maximum(new_rms_db, self.rms_db - fall)
+        held = (new_peak_db >= self.hold_db) | (now > self.hold_until)
+        self.hold_db = np.where(held, self.peak_db, self.hold_db)
+        self.hold_until = np.where(held, now + self.hold_time, self.hold_until)
+        self.clip_until = np.where(clips > 0, now + self.hold_time, self.clip_until)
+        self.update()
+
+    def paintEvent(self, a0: QtGui.QPaintEvent) -> None:
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.normal_bg)
+        if not self.channels:
+            return
+        width = self.width()
+        bar_height = max(1, self.height() // self.channels)
+        now = time.time()
+        rms_color = QtGui.QColor(self.normal_color)
+        rms_color.setAlpha(255)
+        peak_color = QtGui.QColor(self.normal_color)
+        peak_color.setAlpha(120)
+        for channel in range(min(self.channels, self.height())):
+            top = channel * bar_height
+            height = max(1, bar_height - 1)
+            peak_x = int(width * (1 - self.peak_db[channel] / MIN_DB))
+            rms_x = int(width * (1 - self.rms_db[channel] / MIN_DB))
+            hold_x = int(width * (1 - self.hold_db[channel] / MIN_DB))
+            painter.fillRect(0, top, peak_x, height, peak_color)
+            painter.fillRect(0, top, rms_x, height, rms_color)
+            if self.hold_db[channel] > MIN_DB:
+                painter.fillRect(max(0, hold_x - 2), top, 2, height, self.highlight_bg)
+            if now < self.clip_until[channel]:
+                painter.fillRect(width - 4, top, 4, height, self.clip_color)
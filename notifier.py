@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the notification service, and the backends it can show
+notifications with."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import importlib.util
+import logging
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+# Notifications posted within this many seconds of each other are delivered together.
+COALESCE_SECONDS = 0.25
+# Notifications beyond this many waiting are dropped, oldest first.
+MAX_QUEUED_NOTIFICATIONS = 32
+# How long a notification stays on screen, in seconds.
+DISPLAY_SECONDS = 3
+
+logger = logging.getLogger(__name__)
+
+
+class ToastBackend:
+    """This class shows notifications as Windows toasts, with the optional win10toast
+    module. It is only imported when the first notification is shown."""
+
+    def __init__(self, icon_path: str = None, duration: int = DISPLAY_SECONDS):
+        self.icon_path = icon_path
+        self.duration = duration
+        self.toaster = None
+
+    @staticmethod
+    def is_available() -> bool:
+        """:returns whether win10toast is installed, without importing it."""
+
+        return sys.platform == "win32" and importlib.util.find_spec("win10toast") is not None
+
+    def show(self, title: str, message: str):
+        if self.toaster is None:
+            from win10toast import ToastNotifier
+            self.toaster = ToastNotifier()
+        # Not threaded: the notification thread already keeps this off the GUI thread.
+        self.toaster.show_toast(title, message, self.icon_path, self.duration, False)
+
+
+class NotifySendBackend:
+    """This class shows notifications through the freedesktop notification service
+    (D-Bus), with the notify-send command that desktop Linux systems ship with."""
+
+    def __init__(self, icon_path: str = None, duration: int = DISPLAY_SECONDS):
+        self.icon_path = icon_path
+        self.duration = duration
+
+    @staticmethod
+    def is_available() -> bool:
+        return sys.platform.startswith("linux") and shutil.which("notify-send") is not None
+
+    def show(self, title: str, message: str):
+        command = ["notify-send", "--app-name", title, "--expire-time", str(self.duration * 1000)]
+        if self.icon_path:
+            command += ["--icon", self.icon_path]
+        subprocess.run(command + [title, message], check=True, timeout=5, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+
+
+class BannerBackend:
+    """This class shows notifications inside the application window. post(title,
+    message) is called from the notification thread, so it must hand the notification
+    to the GUI thread (e.g. through a UiBridge) rather than touch widgets itself."""
+
+    def __init__(self, post):
+        self.post = post
+
+    def show(self, title: str, message: str):
+        self.post(title, message)
+
+
+class LoggingBackend:
+    """This class only logs notifications, for headless and test runs."""
+
+    def show(self, title: str, message: str):
+        logger.info("notification: %s: %s", title, message.replace("\n", " "))
+
+
+def get_system_backends(icon_path: str = None) -> list:
+    """:returns the desktop notification backends available on this system, possibly
+    none."""
+
+    backends = []
+    if ToastBackend.is_available():
+        backends.append(ToastBackend(icon_path))
+    elif NotifySendBackend.is_available():
+        backends.append(NotifySendBackend(icon_path))
+    return backends
+
+
+class NotificationService:
+    """This class delivers notifications on a background thread, so that showing one
+    never blocks the caller.
+
+    notify() only puts the notification on a bounded queue; the notification thread,
+    started by the first notify(), shows it with every backend in backends. A backend is
+    any object with show(title, message). A backend that raises is logged and skipped,
+    and never affects the others or the caller.
+
+    Notifications that arrive within coalesce_seconds of each other form a burst. Within a
+    burst, a notification replaces an earlier one with the same key (e.g. a progress
+    update), and identical notifications are shown once. If the queue is full, the oldest
+    notification is dropped."""
+
+    def __init__(self, backends: list = None, title: str = "", coalesce_seconds: float = COALESCE_SECONDS,
+                 max_queued: int = MAX_QUEUED_NOTIFICATIONS):
+        self.backends = backends if backends is not None else [LoggingBackend()]
+        self.title = title
+        self.coalesce_seconds = coalesce_seconds
+        self.notification_queue = queue.Queue(maxsize=max_queued)
+        self.notification_thread = None
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.dropped = 0
+
+    def notify(self, message: str, key: str = None, title: str = None):
+        """Queues a notification, and :returns right away. Safe to call from any thread."""
+
+        self._start()
+        item = (title or self.title, message, key)
+        while True:
+            try:
+                self.notification_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.notification_queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self, timeout: float = 2.0):
+        """Delivers the notifications still queued, waiting at most timeout seconds, and
+        stops the notification thread."""
+
+        with self.lock:
+            thread, self.notification_thread = self.notification_thread, None
+        if thread is None:
+            return
+        try:
+            self.notification_queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def _start(self):
+        with self.lock:
+            if self.notification_thread is not None:
+                return
+            self.notification_thread = threading.Thread(target=self._notify_loop)
+            self.notification_thread.setDaemon(True)
+            self.notification_thread.setName("Notification Thread")
+            self.notification_thread.start()
+
+    def _notify_loop(self):
+        """Notification thread runs this function. A None item ends it."""
+
+        while True:
+            item = self.notification_queue.get()
+            if item is None:
+                return
+            burst = [item]
+            deadline = time.monotonic() + self.coalesce_seconds
+            stopping = False
+            while True:
+                try:
+                    item = self.notification_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                burst.append(item)
+            for title, message in self._coalesce(burst):
+                self._show(title, message)
+            if stopping:
+                return
+
+    @staticmethod
+    def _coalesce(burst: list) -> list:
+        """:returns the (title, message) pairs of a burst to show, in the order their
+        latest versions were posted."""
+
+        shown = {}
+        for title, message, key in burst:
+            identity = ("key", key) if key is not None else ("message", title, message)
+            shown.pop(identity, None)
+            shown[identity] = (title, message)
+        return list(shown.values())
+
+    def _show(self, title: str, message: str):
+        for backend in self.backends:
+            try:
+                backend.show(title, message)
+            except Exception as e:
+                logger.warning("notification: %s failed: %s", type(backend).__name__, e)
+        self.delivered += 1
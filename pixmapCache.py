@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the process-wide cache of the scaled icons of the UI."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+
+from PyQt5 import QtGui
+from PyQt5.QtCore import Qt
+
+# Where the scaled icons are kept between runs, when the disk cache is enabled.
+PIXMAP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".audiorecorder", "pixmaps")
+# Bumped whenever the format of the cached files changes, so old files are never read.
+CACHE_VERSION = 1
+# magic, version, width, height, bytes per line
+HEADER_FORMAT = "<4sIIII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b"ARPX"
+# The format of the cached pixels, which is the one Qt paints pixmaps from without converting.
+IMAGE_FORMAT = QtGui.QImage.Format_ARGB32_Premultiplied
+
+logger = logging.getLogger(__name__)
+
+
+class PixmapCache:
+    """This class loads images scaled to a size, for the device pixel ratio of a screen,
+    and keeps them for every later request of the same (path, size, device pixel ratio).
+
+    An image is only decoded and scaled the first time it is asked for. It is scaled
+    smoothly to size * device_pixel_ratio pixels, keeping its aspect ratio, and marked
+    with that ratio, so that it is shown at size on any screen but sharp on HiDPI ones.
+
+    With a cache_dir, the scaled pixels are also saved there as raw premultiplied ARGB
+    files, and later runs load them straight into a QImage, skipping the PNG decode and
+    the scaling. A cached file is named after the path, the size, the device pixel ratio
+    and the modification time and size of the source image, so changing the image makes
+    its old file unused. A cache_dir that cannot be read or written is logged and
+    ignored.
+
+    hits, misses, disk_hits and load_time (the milliseconds spent producing pixmaps) are
+    kept for measuring startup; report() :returns them as a single string."""
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir
+        self.pixmaps = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.load_time = 0.0
+
+    def set_cache_dir(self, cache_dir: str = None):
+        """Enables the disk cache in cache_dir, or disables it with None."""
+
+        self.cache_dir = cache_dir
+
+    def get(self, path: str, width: int, height: int, device_pixel_ratio: float = 1.0) -> QtGui.QPixmap:
+        """:returns the image at path scaled to fit width x height (in device independent
+        pixels). Pixmaps can only be used on the GUI thread, so neither can this."""
+
+        key = (os.path.abspath(path), width, height, round(device_pixel_ratio, 2))
+        with self.lock:
+            pixmap = self.pixmaps.get(key)
+            if pixmap is not None:
+                self.hits += 1
+                return pixmap
+        start_time = time.perf_counter()
+        image = self._load(*key)
+        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(key[3])
+        with self.lock:
+            self.misses += 1
+            self.load_time += (time.perf_counter() - start_time) * 1000
+            return self.pixmaps.setdefault(key, pixmap)
+
+    def clear(self):
+        """Forgets every pixmap held in memory. The disk cache is left alone."""
+
+        with self.lock:
+            self.pixmaps.clear()
+
+    def report(self) -> str:
+        with self.lock:
+            return "%d pixmaps: %d hits, %d misses (%d from disk), %.1f ms loading" % (
+                len(self.pixmaps), self.hits, self.misses, self.disk_hits, self.load_time)
+
+    def get_cache_path(self, path: str, width: int, height: int, device_pixel_ratio: float) -> str:
+        """:returns the path of the disk cache file of a key, or None if the source image
+        does not exist."""
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        identity = "%s|%d|%d|%.2f|%d|%d" % (path, width, height, device_pixel_ratio, stat.st_mtime_ns, stat.st_size)
+        name = "%s-%dx%d@%.2f-%s.argb" % (os.path.splitext(os.path.basename(path))[0], width, height,
+                                          device_pixel_ratio, hashlib.sha1(identity.encode()).hexdigest()[:16])
+        return os.path.join(self.cache_dir, name)
+
+    def _load(self, path: str, width: int, height: int, device_pixel_ratio: float) -> QtGui.QImage:
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_path = self.get_cache_path(path, width, height, device_pixel_ratio)
+            image = self._read(cache_path) if cache_path is not None else None
+            if image is not None:
+                with self.lock:
+                    self.disk_hits += 1
+                return image
+        image = QtGui.QImage(path)
+        if image.isNull():
+            logger.warning("pixmap cache: could not load %s", path)
+            return image
+        image = image.scaled(int(round(width * device_pixel_ratio)), int(round(height * device_pixel_ratio)),
+                             Qt.KeepAspectRatio, Qt.SmoothTransformation).convertToFormat(IMAGE_FORMAT)
+        if cache_path is not None:
+            self._write(cache_path, image)
+        return image
+
+    @staticmethod
+    def _read(cache_path: str) -> QtGui.QImage:
+        """:returns the image saved at cache_path, or None if there is no valid one."""
+
+        try:
+            with open(cache_path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("pixmap cache: could not read %s: %s", cache_path, e)
+            return None
+        if len(data) < HEADER_SIZE:
+            return None
+        magic, version, width, height, bytes_per_line = struct.unpack_from(HEADER_FORMAT, data)
+        if magic != MAGIC or version != CACHE_VERSION or len(data) != HEADER_SIZE + height * bytes_per_line:
+            return None
+        # QImage does not own a buffer it is given, so the pixels are copied out of data.
+        return QtGui.QImage(data[HEADER_SIZE:], width, height, bytes_per_line, IMAGE_FORMAT).copy()
+
+    @staticmethod
+    def _write(cache_path: str, image: QtGui.QImage):
+        """Saves image to cache_path. The file is written under a temporary name and then
+        renamed, so another instance never reads it half written."""
+
+        header = struct.pack(HEADER_FORMAT, MAGIC, CACHE_VERSION, image.width(), image.height(),
+                             image.bytesPerLine())
+        temp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(temp_path, "wb") as file:
+                file.write(header)
+                file.write(image.constBits().asstring(image.bytesPerLine() * image.height()))
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logger.warning("pixmap cache: could not write %s: %s", cache_path, e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+# The cache shared by every ImageChangingLabel of the process. The disk cache is off until
+# set_cache_dir() is called, which the app does at startup.
+pixmap_cache = PixmapCache()
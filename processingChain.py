@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the processing chain that sits between the capture and the writer."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import numpy as np
+import pyaudio
+
+from sampleFormats import get_sample_format
+
+
+class ProcessingChain:
+    """This class runs captured chunks through a list of processing stages before they
+    are written.
+
+    The raw interleaved chunk is converted once to float32 frames (shape (frames,
+    channels), full scale being 1.0) by its SampleFormat, passed through every stage, and
+    converted back to the same sample format. With no stages, process() returns the
+    chunk untouched, without any conversion.
+
+    A stage is any object with:
+    process(block) -> block, called for every chunk, may return fewer or more frames;
+    flush() -> block, called once at the end of the recording, for buffered frames;
+    output_channels, the number of channels of the blocks it returns."""
+
+    def __init__(self, channels: int, sample_format: int = pyaudio.paInt16, stages: list = None):
+        self.channels = channels
+        self.sample_format = get_sample_format(sample_format)
+        self.stages = stages or []
+
+    def get_output_channels(self) -> int:
+        return self.stages[-1].output_channels if self.stages else self.channels
+
+    def process(self, data: bytes) -> bytes:
+        if not self.stages:
+            return data
+        block = self.sample_format.to_float(data).reshape(-1, self.channels)
+        for stage in self.stages:
+            block = stage.process(block)
+        return self.sample_format.from_float(block)
+
+    def flush(self) -> bytes:
+        """:returns whatever the stages still hold, at the end of the recording. The frames
+        flushed by a stage still go through the stages after it."""
+
+        if not self.stages:
+            return b""
+        block = None
+        for stage in self.stages:
+            if block is None:
+                block = stage.flush()
+            else:
+                block = np.concatenate((stage.process(block), stage.flush()))
+        return self.sample_format.from_float(block)
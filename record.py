@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This is the command line audio recorder. It uses the same RecorderEngine as the
+AudioRecorder window, but never imports Qt, so it starts fast and runs on machines
+without a display.
+
+Usage: python record.py [--device INDEX] [--rate RATE] [--output-rate RATE] [--channels N]
+                        [--format {16,24,32,float}] [--select CHANNELS] [--mono]
+                        [--buffer FRAMES] [--adaptive-buffer] [--segment-seconds SECONDS]
+                        [--segment-mb MB] [--segment-clock SECONDS] [--keep N] [--vad {skip,trigger}]
+                        [--vad-threshold DB] [--duration SECONDS] out.wav
+       python record.py --recover"""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+import pyaudio
+
+from channelRouter import parse_channels
+from deviceCatalog import SAMPLE_FORMAT_NAMES
+from recorderEngine import CHUNK, RecorderEngine
+from recorderState import IllegalTransitionError
+from segmenter import DEFAULT_TEMPLATE, SegmentPolicy
+from voiceActivity import MODE_DEFAULTS, THRESHOLD_DB
+
+# --format choice: PortAudio sample format.
+SAMPLE_FORMAT_OPTIONS = {"16": pyaudio.paInt16, "24": pyaudio.paInt24, "32": pyaudio.paInt32,
+                         "float": pyaudio.paFloat32}
+
+
+def parse_args(argv: [str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="record", description="Record audio from an input device.")
+    parser.add_argument("filepath", nargs="?", help="the file to record to (.wav, .flac or .ogg)")
+    parser.add_argument("--device", type=int, default=None,
+                        help="the input device index (default: the system's default input device)")
+    parser.add_argument("--rate", type=int, default=None,
+                        help="the capture rate (default: the device's native rate)")
+    parser.add_argument("--output-rate", type=int, default=None,
+                        help="resample the recording to this rate (default: the capture rate)")
+    parser.add_argument("--channels", type=int, default=None,
+                        help="the number of channels (default: all of the device's input channels)")
+    parser.add_argument("--format", choices=SAMPLE_FORMAT_OPTIONS, default=None,
+                        help="the sample format: 16, 24 or 32-bit integers, or 32-bit float (default: 16)")
+    parser.add_argument("--select", type=parse_channels, default=None, metavar="CHANNELS",
+                        help="only write these input channels, counted from 1 (e.g. 3,4)")
+    parser.add_argument("--mono", action="store_true", help="mix the written channels down to mono")
+    parser.add_argument("--buffer", type=int, default=CHUNK, metavar="FRAMES",
+                        help="the capture buffer size in frames (default: %(default)s)")
+    parser.add_argument("--adaptive-buffer", action="store_true",
+                        help="grow the buffer on overflows and shrink it when idle, starting from --buffer")
+    parser.add_argument("--segment-seconds", type=float, default=None, metavar="SECONDS",
+                        help="start a new file after this many seconds of audio")
+    parser.add_argument("--segment-mb", type=float, default=None, metavar="MB",
+                        help="start a new file before one grows past this many megabytes")
+    parser.add_argument("--segment-clock", type=float, default=None, metavar="SECONDS",
+                        help="start a new file when the clock reaches a multiple of this (e.g. 3600 for every hour)")
+    parser.add_argument("--segment-template", default=DEFAULT_TEMPLATE, metavar="TEMPLATE",
+                        help="how segments are named, from {stem}, {ext}, {index} and {time} (default: %(default)s)")
+    parser.add_argument("--keep", type=int, default=None, metavar="N",
+                        help="only keep the newest N segments (default: keep all of them)")
+    parser.add_argument("--vad", choices=sorted(MODE_DEFAULTS), default=None,
+                        help="leave silence out: skip cuts silent spans short, trigger only records while "
+                             "there is sound")
+    parser.add_argument("--vad-threshold", type=float, default=THRESHOLD_DB, metavar="DB",
+                        help="the level sound starts at, in dBFS (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="stop after this many seconds (default: record until Ctrl+C)")
+    parser.add_argument("--blocking", action="store_true",
+                        help="capture with blocking reads instead of the callback capture engine")
+    parser.add_argument("--list-devices", action="store_true", help="list the input devices and exit")
+    parser.add_argument("--recover", action="store_true",
+                        help="repair (and encode) the recordings interrupted by a crash, and exit")
+    parser.add_argument("--quiet", action="store_true", help="do not print the elapsed time")
+    args = parser.parse_args(argv)
+    if not args.list_devices and not args.recover and not args.filepath:
+        parser.error("the following arguments are required: filepath")
+    return args
+
+
+def list_devices(engine: RecorderEngine):
+    for device in engine.get_input_devices():
+        default = "*" if device.index == engine.input_device_idx else " "
+        print("%s %3d  %s" % (default, device.index, device.get_display_name()))
+        print("       channels: %s" % ", ".join(str(channels) for channels in device.channel_counts))
+        print("       rates: %s" % ", ".join(str(rate) for rate in device.rates))
+        print("       formats: %s" % ", ".join(SAMPLE_FORMAT_NAMES[fmt] for fmt in device.sample_formats))
+
+
+def recover(engine: RecorderEngine) -> int:
+    """Recovers the interrupted recordings, waiting for their encodes. :returns the exit code."""
+
+    errors = []
+
+    def on_recovered(path: str, error: Exception):
+        if error is None:
+            print("Recovered %s" % path, file=sys.stderr)
+        else:
+            errors.append(error)
+            print("Could not recover %s: %s" % (path, error), file=sys.stderr)
+
+    if not engine.recover_recordings(on_recovered):
+        print("No interrupted recordings.", file=sys.stderr)
+    engine.close()
+    return 1 if errors else 0
+
+
+def configure(engine: RecorderEngine, args: argparse.Namespace):
+    """Applies the device, rate, format, output rate, channel, routing, voice activity,
+    buffer and segment options. Raises ValueError if the device does not support them."""
+
+    if args.device is not None:
+        engine.set_input_device(args.device)
+    if args.rate is not None or args.channels is not None or args.format is not None:
+        engine.ensure_ready()
+        sample_format = engine.sample_format if args.format is None else SAMPLE_FORMAT_OPTIONS[args.format]
+        engine.configure(engine.input_device_idx, args.rate or engine.rate, args.channels or engine.input_channels,
+                         sample_format)
+    engine.set_output_rate(args.output_rate)
+    engine.set_routing(args.select, args.mono)
+    engine.set_voice_activity(args.vad, args.vad_threshold)
+    engine.set_buffer_size(args.buffer, args.adaptive_buffer)
+    max_bytes = None if args.segment_mb is None else int(args.segment_mb * 1024 * 1024)
+    engine.set_segmenting(SegmentPolicy(args.segment_seconds, max_bytes, args.segment_clock, args.keep,
+                                        args.segment_template))
+
+
+def record(engine: RecorderEngine, args: argparse.Namespace) -> int:
+    """Records until the duration is reached or Ctrl+C is pressed. :returns the exit code."""
+
+    errors = []
+    engine.on_error = errors.append
+    engine.on_segment = lambda path: print("\rSaved segment %s" % path, file=sys.stderr)
+    try:
+        try:
+            configure(engine, args)
+        except ValueError as e:
+            print(str(e).replace("\n", " "), file=sys.stderr)
+            return 2
+        try:
+            engine.start(args.filepath)
+        except OSError as e:
+            print(f"Could not create file: {e.strerror}", file=sys.stderr)
+            return 1
+        except ValueError as e:
+            print(str(e).replace("\n", " "), file=sys.stderr)
+            return 2
+        started = time.time()
+        try:
+            while engine.state.is_active():
+                if args.duration is not None and time.time() - started >= args.duration:
+                    break
+                if not args.quiet:
+                    activity = "waiting for sound" if engine.is_waiting_for_sound() else engine.input_device_name
+                    print("\r%s  %s" % (time.strftime("%H:%M:%S", time.gmtime(engine.get_elapsed_time())),
+                                        activity), end="", file=sys.stderr, flush=True)
+                time.sleep(.25)
+        except KeyboardInterrupt:
+            pass
+        if not args.quiet:
+            print(file=sys.stderr)
+        try:
+            engine.stop(on_encode_done=lambda path, error: errors.append(error) if error else None)
+        except IllegalTransitionError:
+            # The recording already stopped by itself, because it failed.
+            pass
+    finally:
+        engine.close()
+    for error in errors:
+        print(f"Recording failed: {error}", file=sys.stderr)
+    if errors:
+        return 1
+    if engine.segment_policy is None:
+        print("Saved %s (%.2f s)" % (args.filepath, engine.get_elapsed_time()), file=sys.stderr)
+    else:
+        print("Recorded %.2f s in segments of %s" % (engine.get_elapsed_time(), args.filepath), file=sys.stderr)
+    health = engine.health.snapshot()
+    if health["overflows"] or health["dropped_frames"]:
+        print("Warning: %d input overflows, %d frames dropped" % (health["overflows"], health["dropped_frames"]),
+              file=sys.stderr)
+    return 0
+
+
+def main(argv: [str] = None) -> int:
+    args = parse_args(argv)
+    engine = RecorderEngine(use_callback_capture=not args.blocking)
+    if args.list_devices:
+        list_devices(engine)
+        engine.close()
+        return 0
+    if args.recover:
+        return recover(engine)
+    return record(engine, args)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,941 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the recording engine. It has no GUI dependencies, and is used both
+by the AudioRecorder window and by the command line recorder."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import contextlib
+import logging
+import os
+import threading
+import time
+
+import pyaudio
+
+from captureEngine import CallbackCapture
+from bufferSizer import AdaptiveBufferSizer, MAX_BUFFER_FRAMES, MIN_BUFFER_FRAMES
+from captureHealth import CaptureHealth
+from channelRouter import ChannelRouter, get_mono_matrix
+from deviceCatalog import DeviceCatalog, InputDevice, SAMPLE_FORMAT_NAMES
+from encoder import EncoderPool, needs_encoding
+from processingChain import ProcessingChain
+from recorderState import RecorderState, RecorderStateMachine, IllegalTransitionError
+from recovery import JOURNAL_DIR, JournalKeeper, RecordingJournal, find_interrupted, remove_journal, repair
+from resampler import PolyphaseResampler
+from sampleFormats import SAMPLE_FORMATS, get_sample_format
+from segmenter import SegmentedWavWriter, SegmentPolicy, SegmentRetention
+from voiceActivity import MODE_DEFAULTS, MODE_TRIGGER, THRESHOLD_DB, VoiceActivityDetector
+from ringBuffer import RingReader
+from wavWriter import StreamingWavWriter
+
+# The capture buffer size, in frames. With ADAPTIVE_BUFFER it is only the starting size.
+CHUNK = 1024
+ADAPTIVE_BUFFER = False
+# Seconds of audio kept while idle and prepended to the next recording; 0 disables pre-roll.
+PREROLL_SECONDS = 0.0
+# How much audio the capture's ring buffer holds for the recording thread, besides the pre-roll.
+RING_SECONDS = 2.0
+SAMPLE_FORMAT = pyaudio.paInt16
+# The rate used until the input device has been probed; recordings use the device's native rate.
+FPS = 44100
+# The sample formats the writer, meters and views can handle.
+SUPPORTED_SAMPLE_FORMATS = tuple(SAMPLE_FORMATS)
+# When True, capture uses PyAudio's callback mode and a ring buffer instead of blocking reads.
+USE_CALLBACK_CAPTURE = True
+# When True, pausing keeps the stream running and drops the audio, so resuming is instant.
+HOT_PAUSE = True
+# When True, each recording's capture health is saved next to it, in filepath + HEALTH_SIDECAR_SUFFIX.
+WRITE_HEALTH_SIDECAR = True
+HEALTH_SIDECAR_SUFFIX = ".health.json"
+# With voice activity detection, its decisions are saved next to the recording, in filepath + VAD_SIDECAR_SUFFIX.
+VAD_SIDECAR_SUFFIX = ".vad.json"
+# How often the writer makes the file valid on disk, in seconds; None only syncs when the file is closed.
+SYNC_INTERVAL = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+class RecorderEngine:
+    """This class records audio from an input device to a file, without any GUI.
+
+    The public API is start(filepath), pause(), resume(), stop() and status(). All
+    transitions go through a RecorderStateMachine (self.state), which rejects illegal ones
+    with an IllegalTransitionError.
+
+    Each recording gets one recording thread, which streams the captured audio to a
+    StreamingWavWriter. Every chunk written is also passed to the callables in
+    chunk_listeners (on the recording thread), which is how meters and views are fed.
+    If the recording fails, the engine closes everything, marks the recording as stopped
+    and calls on_error with the exception, from the recording thread.
+
+    Audio is captured at the device's native rate by default. Between the capture and the
+    writer, a processing chain can route the channels (set_routing(), e.g. keep channels
+    3 and 4 only, or mix down to mono) with a ChannelRouter, and convert the rate
+    (set_output_rate()) with a PolyphaseResampler. The file gets the routed channel count.
+    With set_voice_activity(), a VoiceActivityDetector between the two leaves silence out:
+    in skip mode, silent spans are cut short; in trigger mode, the recording waits for
+    sound and goes back to waiting after a long silence (is_waiting_for_sound()), without
+    a state change, so the stream keeps running and no onset is lost. Its decisions are
+    saved as a JSON sidecar, and on_voice(active, seconds), if set, is called with each.
+    Any of the SUPPORTED_SAMPLE_FORMATS (16, 24 and 32-bit integers, 32-bit float) is
+    captured, processed and written as is; see sampleFormats.
+
+    The capture buffer size (set_buffer_size()) is both the host buffer of the stream
+    and the size of each blocking read. In adaptive mode an AdaptiveBufferSizer grows it
+    when the capture health reports overflows or late reads, and shrinks it when the
+    recording has been clean for a while. The sizes used are logged.
+
+    Pausing is a hot pause by default (hot_pause): the stream keeps running while paused,
+    and the recording thread drops what it captures, so resuming takes effect at the next
+    buffer, without the latency and glitches of restarting the device. With hot_pause
+    False, pausing stops the stream and resuming restarts it. Either way, the time from
+    resume() to the first sample written is measured, logged, and kept in the capture
+    health.
+
+    With a pre-roll (set_preroll()), a CallbackCapture is kept running while the engine
+    is idle, so its ring buffer always holds the last preroll_seconds of audio. Nothing
+    reads it until start(), which takes the capture over and begins the file with that
+    audio, without a gap. Idle, the only work is PortAudio's callback copying each buffer
+    into the ring, and memory is bounded by the ring: (preroll_seconds + RING_SECONDS) x
+    rate x channels x sample width.
+
+    With a SegmentPolicy (set_segmenting()), the recording is written by a
+    SegmentedWavWriter, which rolls over to a new file by duration, size or wall-clock
+    boundary. Full segments are finalized (and encoded, for compressed formats) off the
+    recording thread, and a SegmentRetention deletes the oldest ones beyond policy.keep.
+    on_segment, if set, is called with the path of each finished segment.
+
+    Every recording gets a CaptureHealth (self.health), which counts input overflows,
+    dropped frames, ring buffer fill, read latency and writer queue depth. It is included
+    in status(), and saved as a JSON sidecar next to the recording when it is finalized.
+
+    Files with a compressed extension (see encoder.FORMATS) are recorded to a temporary
+    .wav and encoded in a worker process once stop() is called.
+
+    Recordings are crash safe: the writer rewrites the header and fsyncs the file every
+    sync_interval seconds, and each recording has a RecordingJournal in journal_dir until
+    it is finalized (and encoded). After a crash, recover_recordings() repairs the files
+    of the journals left behind and finishes their encodes.
+
+    p is the PyAudio object to use. It defaults to a new pyaudio.PyAudio(), and can be
+    replaced by any object with the same interface (e.g. a fake backend for testing).
+
+    Initializing PortAudio and probing the devices can take hundreds of milliseconds, so
+    it is not done in the constructor. warm_up() starts it on a background thread, and
+    every method that needs it calls ensure_ready(), which waits for it (or does it right
+    away if warm_up() was never called). on_ready, if set, is called from the background
+    thread once it is done."""
+
+    def __init__(self, p: pyaudio.PyAudio = None, use_callback_capture: bool = USE_CALLBACK_CAPTURE):
+        self.p = p
+        self.owns_p = p is None
+        self.catalog = None
+        self.use_callback_capture = use_callback_capture
+        self.hot_pause = HOT_PAUSE
+        # When resume() was called, until the first chunk after it is written.
+        self.resume_time = None
+        self.state = RecorderStateMachine()
+        self.filepath = ""
+        self.recording_path = ""
+        self.rate = FPS
+        self.output_rate = None
+        # The input channels to write (counted from 0, None for all), and whether to mix them to mono.
+        self.route_channels = None
+        self.route_mono = False
+        self.sample_format = SAMPLE_FORMAT
+        self.chunk = CHUNK
+        self.adaptive_buffer = ADAPTIVE_BUFFER
+        # The buffer size in use by the current recording, and its adaptive sizer.
+        self.buffer_frames = CHUNK
+        self.buffer_sizer = None
+        self.preroll_seconds = PREROLL_SECONDS
+        self.preroll_capture = None
+        # While above 0, _arm() waits for the end of deferred_arming().
+        self.arm_deferred = 0
+        self.segment_policy = None
+        self.segment_retention = None
+        # The voice activity mode (None to keep everything), and the detector of the current recording.
+        self.vad_mode = None
+        self.vad_threshold_db = THRESHOLD_DB
+        self.vad = None
+        self.on_voice = None
+        self.on_segment = None
+        # The encode callbacks given to stop(), for the last segment of a segmented recording.
+        self.stop_callbacks = (None, None)
+        self.frames_recorded = 0
+        self.chunk_listeners = []
+        self.on_error = None
+        self.stream = None
+        self.stream_frames = None
+        self.capture = None
+        self.writer = None
+        self.chain = None
+        self.health = None
+        self.write_health_sidecar = WRITE_HEALTH_SIDECAR
+        self.sync_interval = SYNC_INTERVAL
+        # None disables the journals, and with them the recovery.
+        self.journal_dir = JOURNAL_DIR
+        self.journal_keeper = JournalKeeper()
+        self.recording_thread = None
+        self.encoder_pool = EncoderPool()
+        self.on_ready = None
+        self.init_thread = None
+        self.init_error = None
+
+    def warm_up(self):
+        """Starts initializing PortAudio and probing the default devices on a background
+        thread. Calling it again has no effect."""
+
+        if self.init_thread is not None:
+            return
+        self.init_thread = threading.Thread(target=self._init_portaudio)
+        self.init_thread.setDaemon(True)
+        self.init_thread.setName("PortAudio Init Thread")
+        self.init_thread.start()
+
+    def ensure_ready(self):
+        """Waits until PortAudio is initialized. Raises the error initialization failed with,
+        if any (e.g. OSError when there is no input device)."""
+
+        self.warm_up()
+        self.init_thread.join()
+        if self.init_error is not None:
+            raise self.init_error
+
+    def is_ready(self) -> bool:
+        return self.init_thread is not None and not self.init_thread.is_alive() and self.init_error is None
+
+    def _init_portaudio(self):
+        """PortAudio init thread runs this function."""
+
+        try:
+            self._init_default_devices()
+        except Exception as e:
+            self.init_error = e
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def _init_default_devices(self):
+        """Gets the dictionaries of the default input and output devices, and set the
+        default values for them."""
+
+        if self.p is None:
+            self.p = pyaudio.PyAudio()
+        if self.catalog is None:
+            self.catalog = DeviceCatalog(self.p)
+        else:
+            self.catalog.refresh(self.p)
+        self.input_device_dict = self.p.get_default_input_device_info()
+        self.input_device_idx = self.input_device_dict['index']
+        self.input_device_name = self.input_device_dict["name"]
+        self.input_channels = self.input_device_dict['maxInputChannels']
+        self.default_sample_rate = self.input_device_dict['defaultSampleRate']
+        self.rate = int(self.default_sample_rate)
+
+        self.output_device_dict = self.p.get_default_output_device_info()
+        self.output_device_num = self.output_device_dict['index']
+        self.output_device_name = self.output_device_dict["name"]
+
+    def get_input_devices(self) -> [InputDevice]:
+        """:returns all the input devices from the device catalog, with what they support."""
+
+        self.ensure_ready()
+        return self.catalog.get_input_devices()
+
+    def refresh_devices(self):
+        """Enumerates the devices again, e.g. after one was plugged in. PortAudio has to be
+        reinitialized for that, so this is not allowed while recording. If the selected
+        input device is gone, the default input device is selected again."""
+
+        self.ensure_ready()
+        if self.state.is_active():
+            raise IllegalTransitionError("refresh", self.state.get_state(),
+                                         "Devices cannot be refreshed\nwhile recording.")
+        selected = (self.input_device_name, self.rate, self.input_channels, self.sample_format)
+        self._disarm()
+        if self.owns_p:
+            self.p.terminate()
+            self.p = None
+        with self.deferred_arming():
+            self._init_default_devices()
+            device = next((device for device in self.catalog.get_input_devices() if device.name == selected[0]),
+                          None)
+            if device is not None:
+                try:
+                    self.configure(device.index, *selected[1:])
+                except ValueError:
+                    self.set_input_device(device.index)
+
+    def set_input_device(self, index: int):
+        """Records from the input device with the given PortAudio index, with all of its
+        input channels, at its native rate."""
+
+        self.ensure_ready()
+        device = self.catalog.get_device(index)
+        if device is None:
+            raise ValueError("There is no input device with index %d." % index)
+        self.configure(index, device.default_rate, device.max_input_channels, self.sample_format)
+
+    def configure(self, device_index: int, rate: int, channels: int, sample_format: int):
+        """Sets exactly the device, rate, channel count and sample format to record with.
+        Raises ValueError if the device does not support that configuration."""
+
+        self.ensure_ready()
+        self.state.check("start")
+        device = self.catalog.get_device(device_index)
+        if device is None:
+            raise ValueError("There is no input device with index %d." % device_index)
+        if sample_format not in SUPPORTED_SAMPLE_FORMATS:
+            raise ValueError("%s samples are not supported." % SAMPLE_FORMAT_NAMES.get(sample_format, sample_format))
+        if not device.is_supported(self.p, rate, channels, sample_format):
+            raise ValueError("%s does not support %d channels\nof %s samples at %d Hz."
+                             % (device.name, channels, SAMPLE_FORMAT_NAMES[sample_format], rate))
+        self.input_device_dict = self.p.get_device_info_by_index(device_index)
+        self.input_device_idx = device_index
+        self.input_device_name = device.name
+        self.input_channels = channels
+        self.default_sample_rate = device.default_rate
+        self.rate = rate
+        self.sample_format = sample_format
+        if self.route_channels is not None and max(self.route_channels) >= channels:
+            self.route_channels = None
+        self._arm()
+
+    def get_sample_width(self) -> int:
+        return self.p.get_sample_size(self.sample_format)
+
+    def set_buffer_size(self, frames: int = CHUNK, adaptive: bool = False):
+        """Sets the capture buffer size in frames, and whether it adapts to the machine's
+        load during recordings, starting from frames."""
+
+        self.state.check("start")
+        if not MIN_BUFFER_FRAMES <= frames <= MAX_BUFFER_FRAMES:
+            raise ValueError("The buffer size must be between %d and %d frames." % (MIN_BUFFER_FRAMES,
+                                                                                      MAX_BUFFER_FRAMES))
+        self.chunk = frames
+        self.adaptive_buffer = adaptive
+        self._arm()
+
+    def set_preroll(self, seconds: float = 0.0):
+        """Keeps the last seconds of audio while idle, to begin the next recording with.
+        0 disables the pre-roll. Raises ValueError if the engine uses blocking capture."""
+
+        self.state.check("start")
+        if seconds < 0:
+            raise ValueError("The pre-roll cannot be negative.")
+        if seconds and not self.use_callback_capture:
+            raise ValueError("Pre-roll needs the callback capture engine.")
+        self.preroll_seconds = seconds
+        if seconds:
+            self.ensure_ready()
+        self._arm()
+
+    def _arm(self):
+        """(Re)starts the pre-roll capture with the current configuration, or stops it if the
+        pre-roll is disabled."""
+
+        if self.arm_deferred:
+            return
+        self._disarm()
+        if not self.preroll_seconds or not self.is_ready():
+            return
+        self.preroll_capture = CallbackCapture(self.p, self.input_channels, self.rate, self.sample_format,
+                                               self.chunk, self.input_device_idx,
+                                               ring_seconds=self.preroll_seconds + RING_SECONDS)
+        self.preroll_capture.start()
+        logger.info("pre-roll: armed with %.1f s (%d bytes)", self.preroll_seconds,
+                    self.preroll_capture.ring.capacity)
+
+    @contextlib.contextmanager
+    def deferred_arming(self):
+        """Changes made inside this context only (re)start the pre-roll capture once, when
+        it exits, instead of once for each setting changed."""
+
+        self.arm_deferred += 1
+        try:
+            yield
+        finally:
+            self.arm_deferred -= 1
+            if not self.arm_deferred:
+                self._arm()
+
+    def _disarm(self):
+        if self.preroll_capture is not None:
+            self.preroll_capture.close()
+            self.preroll_capture = None
+
+    def set_segmenting(self, policy: SegmentPolicy = None):
+        """Splits recordings into segments according to policy. None records to a single
+        file."""
+
+        self.state.check("start")
+        self.segment_policy = policy if policy is not None and policy.is_enabled() else None
+
+    def set_voice_activity(self, mode: str = None, threshold_db: float = THRESHOLD_DB):
+        """Leaves silence out of recordings, see voiceActivity. mode is MODE_SKIP,
+        MODE_TRIGGER, or None to record everything. Raises ValueError for other modes."""
+
+        self.state.check("start")
+        if mode is not None and mode not in MODE_DEFAULTS:
+            raise ValueError("Unknown voice activity mode %r." % mode)
+        self.vad_mode = mode
+        self.vad_threshold_db = threshold_db
+
+    def is_waiting_for_sound(self) -> bool:
+        """:returns True while a sound-triggered recording is waiting for sound."""
+
+        vad = self.vad
+        return vad is not None and vad.mode == MODE_TRIGGER and not vad.is_active()
+
+    def _on_voice_change(self, active: bool, seconds: float):
+        """Recording thread calls this function when the detector's decision changes."""
+
+        logger.info("vad: sound %s at %.2f s", "started" if active else "ended", seconds)
+        if self.on_voice is not None:
+            self.on_voice(active, seconds)
+
+    def set_output_rate(self, rate: int = None):
+        """Sets the rate recordings are written at. None writes them at the capture rate."""
+
+        self.state.check("start")
+        if rate is not None and rate <= 0:
+            raise ValueError("%d Hz is not a valid output rate." % rate)
+        self.output_rate = rate
+
+    def set_routing(self, channels: [int] = None, mono: bool = False):
+        """Sets the input channels to write, counted from 0 (None for all of them), and
+        whether to mix them down to mono. Raises ValueError if a channel is not captured."""
+
+        self.ensure_ready()
+        self.state.check("start")
+        self._create_router(channels, mono)
+        self.route_channels = None if channels is None else list(channels)
+        self.route_mono = mono
+
+    def _create_router(self, channels: [int], mono: bool) -> ChannelRouter:
+        selected = self.input_channels if channels is None else len(channels)
+        matrix = get_mono_matrix(selected) if mono and selected > 1 else None
+        return ChannelRouter(self.input_channels, channels, matrix)
+
+    def get_output_rate(self) -> int:
+        """:returns the rate recordings are written at."""
+
+        return self.output_rate or self.rate
+
+    def _create_chain(self) -> ProcessingChain:
+        """:returns the processing chain for a new recording."""
+
+        stages = []
+        channels = self.input_channels
+        router = self._create_router(self.route_channels, self.route_mono)
+        if not router.is_identity():
+            # Routing goes first, so the later stages process as few channels as possible.
+            stages.append(router)
+            channels = router.output_channels
+        self.vad = None
+        if self.vad_mode is not None:
+            # Before resampling, so the levels are measured on the captured audio.
+            self.vad = VoiceActivityDetector(self.rate, channels, self.vad_mode, self.vad_threshold_db)
+            self.vad.on_change = self._on_voice_change
+            stages.append(self.vad)
+        if self.get_output_rate() != self.rate:
+            stages.append(PolyphaseResampler(self.rate, self.get_output_rate(), channels))
+        return ProcessingChain(self.input_channels, self.sample_format, stages)
+
+    def get_frames_recorded(self) -> int:
+        """:returns the number of frames recorded so far, at the input rate. With voice
+        activity detection, only the frames kept in the file are counted."""
+
+        vad = self.vad
+        return vad.frames_out if vad is not None else self.frames_recorded
+
+    def get_elapsed_time(self) -> float:
+        """:returns the duration of the audio recorded so far, in seconds. With voice
+        activity detection, the silence left out of the file is not counted."""
+
+        return self.get_frames_recorded() / self.rate
+
+    def start(self, filepath: str):
+        """Starts recording to filepath. Raises IllegalTransitionError if a recording is
+        already underway, OSError if the file cannot be created or there is no input
+        device, and ValueError if the settings cannot be combined. If it raises, nothing is
+        left open."""
+
+        self.state.check("start")
+        self.ensure_ready()
+        self.filepath = filepath
+        # Compressed formats are recorded to a .wav first, and encoded after stopping.
+        self.recording_path = filepath
+        if needs_encoding(filepath):
+            self.recording_path = filepath + ".part.wav"
+        self.stop_callbacks = (None, None)
+        self.writer = None
+        try:
+            self.chain = self._create_chain()
+            self.writer = self._create_writer()
+            self.writer.open()
+            self.frames_recorded = 0
+            self.resume_time = None
+            self.health = CaptureHealth("callback" if self.use_callback_capture else "blocking", self.rate,
+                                        self.chunk)
+            self.buffer_frames = self.chunk
+            self.buffer_sizer = AdaptiveBufferSizer(self.chunk) if self.adaptive_buffer else None
+        except Exception:
+            self._close_failed_writer()
+            raise
+        logger.info("buffer: %d frames (%.1f ms)%s", self.chunk, 1000 * self.chunk / self.rate,
+                    ", adaptive" if self.adaptive_buffer else "")
+        self.state.start()
+        self.recording_thread = threading.Thread(target=self.record)
+        self.recording_thread.setDaemon(True)
+        self.recording_thread.setName("Recording Thread")
+        self.recording_thread.start()
+
+    def _create_writer(self):
+        """:returns the writer for the recording starting, not opened yet: a
+        SegmentedWavWriter if segmenting is enabled, a StreamingWavWriter otherwise."""
+
+        is_float = get_sample_format(self.sample_format).is_float
+        channels = self.chain.get_output_channels()
+        if self.segment_policy is not None:
+            self.segment_retention = SegmentRetention(self.segment_policy.keep)
+            return SegmentedWavWriter(self.filepath, channels, self.get_sample_width(), self.get_output_rate(),
+                                      self.segment_policy, is_float, self._on_segment_closed,
+                                      self.recording_path[len(self.filepath):], self.sync_interval,
+                                      self.journal_dir)
+        journal = None
+        if self.journal_dir is not None:
+            journal = RecordingJournal(self.journal_dir, self.recording_path, self.filepath, channels,
+                                       self.get_sample_width(), self.get_output_rate(), is_float)
+        return StreamingWavWriter(self.recording_path, channels, self.get_sample_width(), self.get_output_rate(),
+                                  is_float=is_float, sync_interval=self.sync_interval, journal=journal)
+
+    def _close_failed_writer(self):
+        """Closes the writer of a recording that failed to start, ignoring further errors."""
+
+        writer, self.writer = self.writer, None
+        if writer is None:
+            return
+        try:
+            writer.close()
+        except Exception as e:
+            logger.warning("Could not close the writer of %s: %s", self.filepath, e)
+
+    def pause(self) -> RecorderState:
+        return self.state.pause()
+
+    def resume(self) -> RecorderState:
+        self.resume_time = time.perf_counter()
+        try:
+            return self.state.resume()
+        except IllegalTransitionError:
+            self.resume_time = None
+            raise
+
+    def stop(self, on_encode_progress=None, on_encode_done=None) -> RecorderState:
+        """Stops the recording, waits for the recording thread to finalize the file, and
+        :returns the state the recorder was in before stopping. If the file needs encoding,
+        the encode job is started and reported through on_encode_progress(fraction) and
+        on_encode_done(filepath, exception), which are called from a background thread."""
+
+        self.stop_callbacks = (on_encode_progress, on_encode_done)
+        previous_state = self.state.stop()
+        self.recording_thread.join()
+        self.recording_thread = None
+        segmented = isinstance(self.writer, SegmentedWavWriter)
+        self.writer = None
+        # Segments are encoded one by one as they are finalized, see _on_segment_closed().
+        if needs_encoding(self.filepath) and not segmented:
+            self.encoder_pool.submit(self.recording_path, self.filepath, on_encode_progress,
+                                     self._get_encode_done(self.recording_path, on_encode_done))
+        return previous_state
+
+    def _get_encode_done(self, recording_path: str, on_encode_done=None, remove_on_error: bool = False):
+        """:returns an on_done for the encode of recording_path, which removes its journal
+        once the encode succeeded (or failed, with remove_on_error) and then calls
+        on_encode_done. The journal is kept fresh until the encode is done."""
+
+        journal_dir = self.journal_dir
+        journal_keeper = self.journal_keeper
+        if journal_dir is not None:
+            journal_keeper.add(journal_dir, recording_path)
+
+        def on_done(target_path: str, error: Exception):
+            if journal_dir is not None:
+                journal_keeper.remove(journal_dir, recording_path)
+                if error is None or remove_on_error:
+                    remove_journal(journal_dir, recording_path)
+            if error is not None and remove_on_error:
+                logger.warning("recovery: could not encode %s, kept as %s: %s", target_path, recording_path, error)
+            if on_encode_done is not None:
+                on_encode_done(target_path, error)
+
+        return on_done
+
+    def recover_recordings(self, on_recovered=None) -> [str]:
+        """Repairs the recordings left behind by a crash, and submits the encodes that
+        did not finish. on_recovered(path, exception) is called for each one once it is
+        usable (or could not be recovered), from this thread or from a background thread.
+        :returns the paths of the recordings being recovered. Safe to call while recording,
+        since the journal of a recording underway is never stale."""
+
+        if self.journal_dir is None:
+            return []
+        paths = []
+        for journal in find_interrupted(self.journal_dir):
+            if not journal.finalized:
+                try:
+                    frames = repair(journal)
+                except OSError as e:
+                    logger.warning("recovery: could not repair %s: %s", journal.recording_path, e)
+                    journal.remove()
+                    continue
+                if not frames:
+                    # Nothing was recorded into it, e.g. a segment opened ahead of time.
+                    logger.info("recovery: removed %s, which has no audio", journal.recording_path)
+                    try:
+                        os.remove(journal.recording_path)
+                    except OSError as e:
+                        logger.warning("recovery: could not remove %s: %s", journal.recording_path, e)
+                    journal.remove()
+                    continue
+                logger.info("recovery: recovered %.1f s of %s", frames / journal.frame_rate, journal.target_path)
+            paths.append(journal.target_path)
+            if journal.needs_encoding():
+                # A recovered recording that cannot be encoded is not retried at every startup.
+                self.encoder_pool.submit(journal.recording_path, journal.target_path, None,
+                                         self._get_encode_done(journal.recording_path, on_recovered, True))
+            else:
+                journal.remove()
+                if on_recovered is not None:
+                    on_recovered(journal.target_path, None)
+        return paths
+
+    def _on_segment_closed(self, path: str, recording_path: str, error: Exception, is_last: bool):
+        """Segment finalizer thread calls this function for each finalized segment. The
+        last segment's encode is reported through the callbacks given to stop()."""
+
+        if error is not None:
+            logger.warning("Could not finalize segment %s: %s", path, error)
+            return
+        retention = self.segment_retention
+        on_encode_progress, on_encode_done = self.stop_callbacks if is_last else (None, None)
+
+        def on_done(segment_path: str, encode_error: Exception):
+            if encode_error is None:
+                self._on_segment_done(retention, segment_path)
+            if on_encode_done is not None:
+                on_encode_done(segment_path, encode_error)
+
+        if recording_path != path:
+            self.encoder_pool.submit(recording_path, path, on_encode_progress,
+                                     self._get_encode_done(recording_path, on_done))
+        else:
+            self._on_segment_done(retention, path)
+
+    def _on_segment_done(self, retention: SegmentRetention, path: str):
+        retention.add(path)
+        if self.on_segment is not None:
+            self.on_segment(path)
+
+    def status(self) -> dict:
+        ready = self.is_ready()
+        return {
+            "state": self.state.get_state().value,
+            "filepath": self.filepath,
+            "device": self.input_device_name if ready else None,
+            "channels": self.input_channels if ready else None,
+            "output_channels": self.writer.channels if self.writer is not None else None,
+            "rate": self.rate,
+            "output_rate": self.get_output_rate(),
+            "voice_active": self.vad.is_active() if self.vad is not None else None,
+            "frames_captured": self.frames_recorded,
+            "frames_recorded": self.get_frames_recorded(),
+            "elapsed_time": self.get_elapsed_time(),
+            "health": self.health.snapshot() if self.health is not None else None,
+        }
+
+    def close(self):
+        """Waits for pending encodes and releases PortAudio. Raises IllegalTransitionError
+        if a recording is still underway."""
+
+        if self.state.is_active():
+            raise IllegalTransitionError("close", self.state.get_state(),
+                                         "You must press stop in\norder to save your recording.")
+        self._disarm()
+        self.encoder_pool.shutdown()
+        self.journal_keeper.close()
+        if self.init_thread is not None:
+            self.init_thread.join()
+        # A PyAudio instance passed in by the caller is theirs to terminate.
+        if self.owns_p and self.p is not None:
+            self.p.terminate()
+            self.p = None
+
+    def record(self):
+        """Recording thread runs this function. If the recording fails, the stream and the
+        writer are closed, the recording is marked as stopped, and on_error is called
+        instead of killing the thread silently."""
+
+        try:
+            if self.use_callback_capture:
+                self.open_continue_callback_recording()
+            else:
+                self.open_continue_recording()
+        except Exception as e:
+            self._abort_recording()
+            if self.on_error is not None:
+                self.on_error(e)
+
+    def _abort_recording(self):
+        """Closes whatever the failed recording thread left open, ignoring further errors,
+        forces the recorder state to stopped, and re-arms the pre-roll if it is enabled."""
+
+        for close in (self.stream.close if self.stream else None, self.capture.close if self.capture else None,
+                      self.writer.close if self.writer else None):
+            try:
+                if close:
+                    close()
+            except Exception:
+                pass
+        if self.capture is self.preroll_capture:
+            self.preroll_capture = None
+        self.stream = None
+        self.capture = None
+        try:
+            if self.state.is_active():
+                self.state.stop()
+            self.state.finish()
+        except IllegalTransitionError:
+            pass
+        try:
+            self._arm()
+        except Exception as e:
+            logger.warning("pre-roll: could not re-arm after the failed recording: %s", e)
+
+    def open_continue_recording(self):
+        """This function actually does the recording. It will open a stream and enter a
+        while True loop. If paused, it will keep reading and drop what it reads (hot pause),
+        or stop the stream and block until the state changes. If recording, it will check to
+        see if the stream is started, and then hand each chunk to the writer, which streams
+        it to disk. When stopping, the loop will stop the stream, close it and the writer,
+        mark the recording as stopped, and return, causing the associated recording thread
+        to terminate."""
+
+        self._open_stream()
+        last_read = None
+        while True:
+            state = self.state.get_state()
+            if state is RecorderState.RECORDING:
+                if self.stream.is_stopped():
+                    if self.stream_frames != self.buffer_frames:
+                        self._open_stream()
+                    else:
+                        self.stream.start_stream()
+                    last_read = None
+                started = time.perf_counter()
+                if last_read is not None:
+                    self.health.add_interval(started - last_read)
+                last_read = started
+                try:
+                    data = self.stream.read(self.buffer_frames)
+                except IOError as e:
+                    if e.args[-1] != pyaudio.paInputOverflowed:
+                        raise
+                    # PyAudio discards the buffer that overflowed.
+                    self.health.add_overflow(self.buffer_frames)
+                    if self._adapt_buffer():
+                        last_read = None
+                    continue
+                self.health.add_read(time.perf_counter() - started)
+                self._write_chunk(data)
+                self._check_resumed()
+                if self._adapt_buffer():
+                    # The time taken to reopen the stream is not a late read.
+                    last_read = None
+            elif state is RecorderState.PAUSED and self.hot_pause:
+                # A smaller buffer costs nothing to apply while the audio is dropped anyway.
+                if self.stream_frames != self.buffer_frames:
+                    self._open_stream()
+                self.stream.read(self.buffer_frames, exception_on_overflow=False)
+                last_read = None
+            elif state is RecorderState.PAUSED:
+                if not self.stream.is_stopped():
+                    self.stream.stop_stream()
+                self.state.wait_while(state)
+            else:
+                self.stream.stop_stream()
+                self.stream.close()
+                self.stream = None
+                self._finish_writing()
+                self.state.finish()
+                return
+
+    def open_continue_callback_recording(self):
+        """This function does the recording with the callback capture engine. PortAudio's
+        thread fills the capture's ring buffer, and this thread only drains it into the
+        writer. Pausing skips what the ring receives while paused (hot pause), or stops the
+        stream, and stopping drains whatever is left in the ring before closing the writer.
+        With a pre-roll, the armed capture is taken over instead of opening a new one, and
+        is kept running once the recording is finalized."""
+
+        if self.preroll_capture is not None:
+            # Take over the armed capture, starting with the audio it already holds.
+            self.capture = self.preroll_capture
+            self.capture.health = self.health
+            reader = self.capture.add_reader(self.preroll_seconds)
+        else:
+            self.capture = CallbackCapture(self.p, self.input_channels, self.rate, self.sample_format,
+                                           self.buffer_frames, self.input_device_idx, health=self.health)
+            reader = self.capture.add_reader()
+        self.capture.start()
+        paused = False
+        while True:
+            state = self.state.get_state()
+            if state is RecorderState.RECORDING:
+                if paused:
+                    paused = False
+                    # Drop what came in since the last check while paused.
+                    reader.skip()
+                if not self.capture.is_active():
+                    if self.capture.frames_per_buffer != self.buffer_frames:
+                        self.capture.reopen(self.buffer_frames)
+                    self.capture.start()
+                if reader.wait(.2):
+                    self._write_from_reader(reader)
+                    self._check_resumed()
+                self._adapt_buffer()
+            elif state is RecorderState.PAUSED:
+                if not paused:
+                    paused = True
+                    if not self.hot_pause:
+                        self.capture.stop()
+                    self._write_from_reader(reader)
+                if self.hot_pause:
+                    if self.capture.frames_per_buffer != self.buffer_frames:
+                        self.capture.reopen(self.buffer_frames)
+                    # Wakes at every buffer, so a resume is noticed at the next one.
+                    reader.wait(.2)
+                    reader.skip()
+                else:
+                    self.state.wait_while(state)
+            else:
+                armed = self.capture is self.preroll_capture
+                if not armed:
+                    self.capture.close()
+                if paused:
+                    reader.skip()
+                self._write_from_reader(reader)
+                reader.close()
+                self._finish_writing()
+                if armed:
+                    # Keep the capture running for the next recording's pre-roll.
+                    self.capture.health = None
+                    self.capture.start()
+                self.capture = None
+                self.state.finish()
+                return
+
+    def _open_stream(self):
+        """Opens and starts the blocking stream with the current buffer size, closing the
+        previous one."""
+
+        if self.stream is not None:
+            self.stream.close()
+        self.stream = self.p.open(format=self.sample_format, channels=self.input_channels,
+                                  rate=self.rate, frames_per_buffer=self.buffer_frames, input=True,
+                                  input_device_index=self.input_device_idx)
+        self.stream_frames = self.buffer_frames
+
+    def _adapt_buffer(self) -> bool:
+        """Lets the adaptive sizer change the buffer size. A larger buffer is applied right
+        away, reopening the stream, as the recording is already losing audio. A smaller one
+        only changes the blocking read size; the stream gets it when it is next opened (on
+        resume), so a clean recording never gets a gap from it.
+        :returns whether the stream was reopened."""
+
+        if self.buffer_sizer is None:
+            return False
+        change = self.buffer_sizer.check(self.health)
+        if change is None:
+            return False
+        frames, reason = change
+        grow = frames > self.buffer_frames
+        self.buffer_frames = frames
+        self.health.set_chunk(frames, reason)
+        logger.info("buffer: %d frames (%.1f ms), %s", frames, 1000 * frames / self.rate, reason)
+        if not grow:
+            return False
+        if self.capture is not None:
+            self.capture.reopen(frames)
+        else:
+            self._open_stream()
+        return True
+
+    def _check_resumed(self):
+        """Called after each chunk is written. Records the resume latency if this is the
+        first chunk since resume()."""
+
+        resume_time, self.resume_time = self.resume_time, None
+        if resume_time is None:
+            return
+        latency = time.perf_counter() - resume_time
+        self.health.add_resume(latency)
+        logger.info("pause: resumed in %.1f ms (%s)", 1000 * latency, "hot" if self.hot_pause else "stream restarted")
+
+    def _write_from_reader(self, reader: RingReader):
+        """Hands everything the reader has to the writer, and records how full the ring was
+        and how much of it was overrun."""
+
+        self.health.add_buffer_fill(reader.available() / self.capture.ring.capacity)
+        data = reader.read()
+        self.health.set_ring_dropped_frames(reader.dropped_bytes // self.capture.block_align)
+        if data:
+            self._write_chunk(data)
+
+    def _write_chunk(self, data: bytes):
+        """Runs a captured chunk through the processing chain and writes it, passes it to the
+        chunk listeners, and counts the frames recorded."""
+
+        self.writer.write(self.chain.process(data))
+        self.health.add_queue_depth(self.writer.get_queue_depth())
+        for listener in self.chunk_listeners:
+            listener(data)
+        self.frames_recorded += len(data) // (self.input_channels * self.get_sample_width())
+
+    def _finish_writing(self):
+        """Writes what the processing chain still holds, and closes the writer."""
+
+        data = self.chain.flush()
+        if data:
+            self.writer.write(data)
+        self.writer.close()
+        if self.write_health_sidecar:
+            self._write_health_sidecar()
+        if self.vad is not None:
+            try:
+                self.vad.write_log(self.filepath + VAD_SIDECAR_SUFFIX)
+            except OSError as e:
+                logger.warning("Could not save the voice activity of %s: %s", self.filepath, e)
+
+    def _write_health_sidecar(self):
+        """Saves the capture health next to the recording. A failure is only logged, as the
+        recording itself is already safe."""
+
+        try:
+            self.health.write_sidecar(self.filepath + HEALTH_SIDECAR_SUFFIX, {
+                "file": os.path.basename(self.filepath),
+                "frames_captured": self.frames_recorded,
+                "frames_recorded": self.get_frames_recorded(),
+                "duration": self.get_elapsed_time(),
+            })
+        except OSError as e:
+            logger.warning("Could not save the capture health of %s: %s", self.filepath, e)
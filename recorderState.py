@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the recorder state machine shared by the UI and the worker threads."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import enum
+import threading
+
+
+class RecorderState(enum.Enum):
+    IDLE = "idle"
+    RECORDING = "recording"
+    PAUSED = "paused"
+    STOPPING = "stopping"
+    STOPPED = "stopped"
+
+
+# operation: (states the operation is allowed from, resulting state, error message otherwise)
+OPERATIONS = {
+    "start": ({RecorderState.IDLE, RecorderState.STOPPED}, RecorderState.RECORDING,
+              "A recording is already underway."),
+    "pause": ({RecorderState.RECORDING}, RecorderState.PAUSED,
+              "You must first start a\nrecording to be able to pause."),
+    "resume": ({RecorderState.PAUSED}, RecorderState.RECORDING,
+               "There is no paused\nrecording to resume."),
+    "stop": ({RecorderState.RECORDING, RecorderState.PAUSED}, RecorderState.STOPPING,
+             "Please start recording first."),
+    "finish": ({RecorderState.STOPPING}, RecorderState.STOPPED,
+               "The recording is not stopping."),
+}
+
+
+class IllegalTransitionError(Exception):
+    """Raised when an operation is not allowed in the current state. The message is meant
+    to be shown to the user as is."""
+
+    def __init__(self, operation: str, state: RecorderState, message: str):
+        super(IllegalTransitionError, self).__init__(message)
+        self.operation = operation
+        self.state = state
+
+
+class RecorderStateMachine:
+    """This class holds the recorder's state (idle/recording/paused/stopping/stopped) and
+    is the one place where transitions are validated.
+
+    All transitions go through apply(), which rejects illegal ones with an
+    IllegalTransitionError and wakes every thread blocked in wait_while(). Worker threads
+    should block in wait_while() instead of polling the state, so they use no CPU while
+    nothing is happening."""
+
+    def __init__(self):
+        self.state = RecorderState.IDLE
+        self.condition = threading.Condition()
+
+    def get_state(self) -> RecorderState:
+        return self.state
+
+    def is_active(self) -> bool:
+        """:returns True while there is a recording that has not been stopped."""
+
+        return self.state in (RecorderState.RECORDING, RecorderState.PAUSED)
+
+    def check(self, operation: str):
+        """Raises IllegalTransitionError if operation is not allowed right now."""
+
+        allowed, _, message = OPERATIONS[operation]
+        if self.state not in allowed:
+            raise IllegalTransitionError(operation, self.state, message)
+
+    def apply(self, operation: str) -> RecorderState:
+        """Performs operation, and :returns the state the machine was in before it."""
+
+        with self.condition:
+            self.check(operation)
+            previous_state = self.state
+            self.state = OPERATIONS[operation][1]
+            self.condition.notify_all()
+        return previous_state
+
+    def start(self) -> RecorderState:
+        return self.apply("start")
+
+    def pause(self) -> RecorderState:
+        return self.apply("pause")
+
+    def resume(self) -> RecorderState:
+        return self.apply("resume")
+
+    def stop(self) -> RecorderState:
+        return self.apply("stop")
+
+    def finish(self) -> RecorderState:
+        return self.apply("finish")
+
+    def wait_while(self, state: RecorderState, timeout: float = None) -> RecorderState:
+        """Blocks while the machine is in state, or until timeout. :returns the current state."""
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.state is not state, timeout)
+            return self.state
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the recording journals, and the recovery of recordings that were
+interrupted by a crash."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from wavWriter import JOURNAL_TOUCH_INTERVAL, StreamingWavWriter
+
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".audiorecorder", "journal")
+# A journal that was not touched for this long belongs to a recording that is no longer being written.
+STALE_SECONDS = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+def get_journal_path(journal_dir: str, recording_path: str) -> str:
+    name = hashlib.sha1(os.path.abspath(recording_path).encode("utf-8")).hexdigest()[:20]
+    return os.path.join(journal_dir, name + ".json")
+
+
+def remove_journal(journal_dir: str, recording_path: str):
+    """Removes the journal of recording_path, if there is one."""
+
+    try:
+        os.remove(get_journal_path(journal_dir, recording_path))
+    except FileNotFoundError:
+        pass
+
+
+class RecordingJournal:
+    """This class is a small JSON file, kept in journal_dir while a recording is written,
+    that describes the recording well enough to repair it after a crash.
+
+    The writer creates it when the file is opened and touches it while it writes, so a
+    journal whose file was not modified recently belongs to a recording that is no longer
+    being written. finish() removes it once the file is finalized, or, for a recording
+    that still has to be encoded to target_path, marks it as finalized; a JournalKeeper
+    then keeps touching it until the engine removes it when the encode is done."""
+
+    def __init__(self, journal_dir: str, recording_path: str, target_path: str, channels: int,
+                 sample_width: int, frame_rate: int, is_float: bool = False, finalized: bool = False):
+        self.journal_dir = journal_dir
+        self.recording_path = os.path.abspath(recording_path)
+        self.target_path = os.path.abspath(target_path)
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+        self.is_float = is_float
+        self.finalized = finalized
+        self.path = get_journal_path(journal_dir, recording_path)
+
+    @classmethod
+    def load(cls, path: str) -> "RecordingJournal":
+        with open(path) as file:
+            fields = json.load(file)
+        return cls(os.path.dirname(path), fields["recording_path"], fields["target_path"], fields["channels"],
+                   fields["sample_width"], fields["frame_rate"], fields["is_float"], fields["finalized"])
+
+    def needs_encoding(self) -> bool:
+        return self.recording_path != self.target_path
+
+    def create(self):
+        self._save()
+
+    def touch(self):
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+
+    def finish(self):
+        if self.needs_encoding():
+            self.finalized = True
+            self._save()
+        else:
+            self.remove()
+
+    def remove(self):
+        remove_journal(self.journal_dir, self.recording_path)
+
+    def is_stale(self) -> bool:
+        try:
+            return time.time() - os.path.getmtime(self.path) > STALE_SECONDS
+        except OSError:
+            return False
+
+    def _save(self):
+        """Writes the journal to a temporary file and renames it over the old one, so a
+        crash never leaves half a journal."""
+
+        os.makedirs(self.journal_dir, exist_ok=True)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({
+                "recording_path": self.recording_path,
+                "target_path": self.target_path,
+                "channels": self.channels,
+                "sample_width": self.sample_width,
+                "frame_rate": self.frame_rate,
+                "is_float": self.is_float,
+                "finalized": self.finalized,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+
+
+class JournalKeeper:
+    """This class keeps the journals of finalized recordings that are waiting for their
+    encode fresh, so that another instance never takes them for interrupted ones and
+    encodes them a second time.
+
+    add() and remove() may be called from any thread. The journals are touched every
+    JOURNAL_TOUCH_INTERVAL seconds by the journal keeper thread, which is started by the
+    first add()."""
+
+    def __init__(self, interval: float = JOURNAL_TOUCH_INTERVAL):
+        self.interval = interval
+        self.journal_paths = set()
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.keeper_thread = None
+
+    def add(self, journal_dir: str, recording_path: str):
+        with self.lock:
+            self.journal_paths.add(get_journal_path(journal_dir, recording_path))
+            if self.keeper_thread is None:
+                self.keeper_thread = threading.Thread(target=self._keep_loop)
+                self.keeper_thread.setDaemon(True)
+                self.keeper_thread.setName("Journal Keeper Thread")
+                self.keeper_thread.start()
+
+    def remove(self, journal_dir: str, recording_path: str):
+        with self.lock:
+            self.journal_paths.discard(get_journal_path(journal_dir, recording_path))
+
+    def close(self):
+        """Stops the journal keeper thread."""
+
+        self.closed.set()
+        with self.lock:
+            thread, self.keeper_thread = self.keeper_thread, None
+        if thread is not None:
+            thread.join()
+
+    def _keep_loop(self):
+        """Journal Keeper Thread runs this function, until close() is called."""
+
+        while not self.closed.wait(self.interval):
+            with self.lock:
+                journal_paths = list(self.journal_paths)
+            for journal_path in journal_paths:
+                try:
+                    os.utime(journal_path)
+                except OSError:
+                    pass
+
+
+def find_interrupted(journal_dir: str = JOURNAL_DIR) -> [RecordingJournal]:
+    """:returns the journals of the recordings that were interrupted, skipping those that
+    are still being written (by another instance) and those that cannot be read."""
+
+    journals = []
+    try:
+        names = sorted(os.listdir(journal_dir))
+    except FileNotFoundError:
+        return journals
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            journal = RecordingJournal.load(os.path.join(journal_dir, name))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("recovery: skipping unreadable journal %s: %s", name, e)
+            continue
+        if journal.is_stale():
+            journals.append(journal)
+    return journals
+
+
+def repair(journal: RecordingJournal) -> int:
+    """Finalizes the recording of an interrupted journal: the data chunk is cut to the
+    last whole frame on disk and the header is rewritten to match. Only the header is
+    read and written, so this takes the same time for any length of recording. :returns
+    the number of frames recovered. Raises OSError if the recording is gone."""
+
+    writer = StreamingWavWriter(journal.recording_path, journal.channels, journal.sample_width,
+                                journal.frame_rate, is_float=journal.is_float)
+    with open(journal.recording_path, "r+b") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        data_size = max(0, file_size - writer.header_size)
+        data_size -= data_size % writer.block_align
+        file.truncate(writer.header_size + data_size)
+        file.seek(0, os.SEEK_END)
+        if data_size % 2:
+            file.write(b"\x00")
+        file.seek(0)
+        file.write(writer.get_header(data_size))
+        file.flush()
+        os.fsync(file.fileno())
+    logger.info("recovery: repaired %s (%d frames)", journal.recording_path, data_size // writer.block_align)
+    return data_size // writer.block_align
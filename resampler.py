@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains a streaming polyphase resampler, used to write recordings at a
+different rate than the one they are captured at.
+
+Running this file benchmarks the resampler: python resampler.py [channels] [in_rate] [out_rate]"""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import math
+import sys
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class PolyphaseResampler:
+    """This class converts interleaved multichannel audio from in_rate to out_rate, chunk
+    by chunk, by a rational factor up/down (e.g. 147/160 for 48000 to 44100 Hz).
+
+    The anti-aliasing filter is a Kaiser-windowed sinc with taps_per_phase taps per
+    polyphase branch. Each output frame is the dot product of one branch with the last
+    taps_per_phase input frames; all output frames of a chunk, and all channels, are
+    computed at once with a single einsum over a strided window view of the input, so
+    there is no per-sample Python code.
+
+    The filter delay is compensated, so the output is aligned with the input. process()
+    keeps the input it still needs between calls, and flush() pads the end of the
+    recording so the output has exactly ceil(input frames * up / down) frames."""
+
+    def __init__(self, in_rate: int, out_rate: int, channels: int, taps_per_phase: int = 32,
+                 kaiser_beta: float = 8.6, cutoff: float = 0.92):
+        divisor = math.gcd(int(in_rate), int(out_rate))
+        self.up = int(out_rate) // divisor
+        self.down = int(in_rate) // divisor
+        self.channels = channels
+        self.output_channels = channels
+        self.taps = taps_per_phase
+        self.filters = self._design_filters(kaiser_beta, cutoff)
+        self.delay = (self.up * self.taps - 2) // 2
+        # The buffer starts with taps - 1 frames of silence, so the first outputs have history.
+        self.buffer = np.zeros((self.taps - 1, channels), dtype=np.float32)
+        self.buffer_start = -(self.taps - 1)
+        self.frames_in = 0
+        self.frames_out = 0
+
+    def _design_filters(self, kaiser_beta: float, cutoff: float) -> np.ndarray:
+        """:returns the polyphase branches, shape (up, taps). Branch p holds the prototype
+        taps p, p + up, p + 2 * up, ... in reverse, to line up with a window of input frames
+        that ends with the newest one."""
+
+        length = self.up * self.taps
+        # Cutoff relative to the upsampled rate, in cycles per sample.
+        fc = cutoff * 0.5 / max(self.up, self.down)
+        # An odd-length symmetric filter (the last tap is zero), so the delay is a whole number of samples.
+        n = np.arange(length) - (length - 2) / 2
+        window = np.append(np.kaiser(length - 1, kaiser_beta), 0)
+        prototype = 2 * fc * np.sinc(2 * fc * n) * window
+        prototype *= self.up / prototype.sum()
+        return prototype.reshape(self.taps, self.up).T[:, ::-1].astype(np.float32).copy()
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Resamples block, shape (frames, channels), and :returns the output frames that
+        can be computed so far."""
+
+        self.buffer = np.concatenate((self.buffer, block.astype(np.float32, copy=False)))
+        self.frames_in += len(block)
+        return self._resample()
+
+    def flush(self) -> np.ndarray:
+        """:returns the remaining output frames, at the end of the recording."""
+
+        total_out = -(-self.frames_in * self.up // self.down)
+        if total_out <= self.frames_out:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        last_base = ((total_out - 1) * self.down + self.delay) // self.up
+        padding = max(0, last_base - (self.buffer_start + len(self.buffer)) + 1)
+        self.buffer = np.concatenate((self.buffer, np.zeros((padding, self.channels), dtype=np.float32)))
+        return self._resample(total_out)
+
+    def _resample(self, limit: int = None) -> np.ndarray:
+        buffer_end = self.buffer_start + len(self.buffer)
+        # The last output whose newest input frame is already in the buffer.
+        last = (buffer_end * self.up - 1 - self.delay) // self.down
+        if limit is not None:
+            last = min(last, limit - 1)
+        if last < self.frames_out:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        positions = np.arange(self.frames_out, last + 1, dtype=np.int64) * self.down + self.delay
+        bases = positions // self.up
+        phases = positions % self.up
+        windows = sliding_window_view(self.buffer, self.taps, axis=0)
+        starts = bases - (self.taps - 1) - self.buffer_start
+        output = np.einsum("nct,nt->nc", windows[starts], self.filters[phases])
+        self.frames_out = last + 1
+        # Drop the input that no later output needs.
+        next_base = (self.frames_out * self.down + self.delay) // self.up
+        keep_from = max(0, next_base - (self.taps - 1) - self.buffer_start)
+        self.buffer = self.buffer[keep_from:]
+        self.buffer_start += keep_from
+        return output
+
+
+def benchmark(channels: int = 8, in_rate: int = 48000, out_rate: int = 44100, seconds: float = 20.0,
+              chunk: int = 1024) -> float:
+    """Resamples seconds of noise in chunks of chunk frames, and :returns how many times
+    faster than real time that was."""
+
+    resampler = PolyphaseResampler(in_rate, out_rate, channels)
+    audio = np.random.default_rng(0).uniform(-1, 1, (int(seconds * in_rate), channels)).astype(np.float32)
+    start = time.perf_counter()
+    for offset in range(0, len(audio), chunk):
+        resampler.process(audio[offset:offset + chunk])
+    resampler.flush()
+    return seconds / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:4]]
+    bench_channels, bench_in_rate, bench_out_rate = arguments + [8, 48000, 44100][len(arguments):]
+    print("%d channels, %d Hz -> %d Hz: %.1fx real time" % (
+        bench_channels, bench_in_rate, bench_out_rate, benchmark(bench_channels, bench_in_rate, bench_out_rate)))
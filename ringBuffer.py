@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains a preallocated ring buffer used to hand captured audio from the
+real-time capture callback to the consumers (writer, meters, etc.)."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import threading
+
+
+class RingBuffer:
+    """This is a fixed-size byte ring buffer with a single producer and one or more
+    independent consumers (RingReader objects).
+
+    The producer never blocks and never takes a lock: write() copies the data into the
+    preallocated buffer and only then publishes the new write position. Each reader owns
+    its own read position, so readers never contend with each other or with the producer.
+    Positions only ever increase; the index into the buffer is the position modulo the
+    capacity.
+
+    A reader that falls more than capacity bytes behind has been overrun. It skips ahead
+    to the oldest data still in the buffer and counts the skipped bytes in dropped_bytes.
+    Before copying, write() publishes write_end, the position its copy reaches, so a reader
+    can tell which of the bytes it just copied the producer may have overwritten."""
+
+    def __init__(self, capacity: int, block_align: int = 1):
+        # Keep the capacity a whole number of frames so a frame never straddles an overrun.
+        self.capacity = max(block_align, capacity - (capacity % block_align))
+        self.block_align = block_align
+        self.buffer = bytearray(self.capacity)
+        self.view = memoryview(self.buffer)
+        self.write_pos = 0
+        self.write_end = 0
+        self.readers = ()
+
+    def write(self, data: bytes):
+        """Copies data into the ring. Only the producer thread may call this."""
+
+        data = memoryview(data).cast("B")
+        size = len(data)
+        if size > self.capacity:
+            # Only the newest capacity bytes can be kept anyway.
+            data = data[size - self.capacity:]
+            self.write_pos += size - self.capacity
+            size = self.capacity
+        self.write_end = self.write_pos + size
+        start = self.write_pos % self.capacity
+        first = min(size, self.capacity - start)
+        self.view[start:start + first] = data[:first]
+        if first < size:
+            self.view[:size - first] = data[first:]
+        self.write_pos += size
+        for reader in self.readers:
+            reader.data_event.set()
+
+    def add_reader(self, start_pos: int = None) -> "RingReader":
+        """Creates a new reader. By default it starts at the current write position, so it
+        only sees data written after this call."""
+
+        reader = RingReader(self, self.write_pos if start_pos is None else start_pos)
+        # Replace the tuple rather than mutating it, so the producer never sees a half-updated list.
+        self.readers = self.readers + (reader,)
+        return reader
+
+    def remove_reader(self, reader: "RingReader"):
+        self.readers = tuple(r for r in self.readers if r is not reader)
+
+
+class RingReader:
+    """This class is a single consumer's view of a RingBuffer. It should only be used by
+    one thread."""
+
+    def __init__(self, ring: RingBuffer, start_pos: int):
+        self.ring = ring
+        self.read_pos = max(start_pos, ring.write_pos - ring.capacity)
+        self.dropped_bytes = 0
+        self.data_event = threading.Event()
+
+    def available(self) -> int:
+        """:returns the number of unread bytes, after skipping any overrun data."""
+
+        self._skip_overrun()
+        return self.ring.write_pos - self.read_pos
+
+    def wait(self, timeout: float = None) -> bool:
+        """Blocks until there is unread data, or until timeout. :returns True if there is
+        data to read."""
+
+        if self.available():
+            return True
+        self.data_event.clear()
+        # Check again, the producer may have written between the check and the clear.
+        if self.available():
+            return True
+        self.data_event.wait(timeout)
+        return self.available() > 0
+
+    def peek(self, max_bytes: int = None) -> [memoryview]:
+        """:returns up to two memoryviews over the unread data, without copying it. The
+        views are only valid until consume() is called, and may be overwritten if the reader
+        is overrun in the meantime."""
+
+        size = self.available()
+        if max_bytes is not None:
+            size = min(size, max_bytes - (max_bytes % self.ring.block_align))
+        if size <= 0:
+            return []
+        capacity = self.ring.capacity
+        start = self.read_pos % capacity
+        first = min(size, capacity - start)
+        views = [self.ring.view[start:start + first]]
+        if first < size:
+            views.append(self.ring.view[:size - first])
+        return views
+
+    def consume(self, size: int):
+        self.read_pos += size
+
+    def read(self, max_bytes: int = None) -> bytes:
+        """Copies out and consumes up to max_bytes of unread data. If the producer lapped
+        the reader during the copy, the overwritten start of it is dropped and counted in
+        dropped_bytes, rather than returned as audio."""
+
+        views = self.peek(max_bytes)
+        data = b"".join(views)
+        # Everything before write_end - capacity may have been overwritten while copying.
+        torn = self.ring.write_end - self.ring.capacity - self.read_pos
+        if torn > 0:
+            torn = min(len(data), torn + (-torn % self.ring.block_align))
+            self.dropped_bytes += torn
+            self.consume(torn)
+            data = data[torn:]
+        self.consume(len(data))
+        return data
+
+    def skip(self) -> int:
+        """Consumes all unread data without copying it. :returns the number of bytes skipped."""
+
+        size = self.available()
+        self.consume(size)
+        return size
+
+    def close(self):
+        self.ring.remove_reader(self)
+
+    def _skip_overrun(self):
+        behind = self.ring.write_pos - self.read_pos
+        if behind > self.ring.capacity:
+            self.dropped_bytes += behind - self.ring.capacity
+            self.read_pos = self.ring.write_pos - self.ring.capacity
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the conversions between the raw bytes of each PortAudio sample
+format and NumPy arrays."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import numpy as np
+import pyaudio
+
+
+class SampleFormat:
+    """This class describes how one PortAudio sample format is stored, and converts
+    interleaved chunks of it to and from NumPy arrays.
+
+    decode() is a zero-copy np.frombuffer view for the 16-bit, 32-bit and float formats.
+    Packed 24-bit samples have no NumPy dtype, so they are widened to int32 with a single
+    vectorized copy instead. to_float() scales the samples so that full scale is 1.0, and
+    from_float() converts back, rounding and clipping integer formats."""
+
+    def __init__(self, pa_format: int, sample_width: int, dtype, full_scale: float, is_float: bool = False):
+        self.pa_format = pa_format
+        self.sample_width = sample_width
+        self.dtype = np.dtype(dtype)
+        self.full_scale = full_scale
+        self.is_float = is_float
+        # The extremes a sample can take; samples at either one are counted as clipped.
+        self.min_value = -full_scale
+        self.max_value = full_scale if is_float else full_scale - 1
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """:returns the samples of data, as a flat array of self.dtype."""
+
+        if self.sample_width == 3:
+            packed = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+            widened = np.zeros((len(packed), 4), dtype=np.uint8)
+            widened[:, 1:] = packed
+            # The sample is now in the top three bytes, so the shift restores its sign.
+            return widened.view("<i4").ravel() >> 8
+        return np.frombuffer(data, dtype=self.dtype)
+
+    def to_float(self, data: bytes) -> np.ndarray:
+        """:returns the samples of data as float32, with full scale being 1.0. Float data
+        is returned as a read-only view."""
+
+        samples = self.decode(data)
+        if self.is_float:
+            return samples
+        block = samples.astype(np.float32)
+        block *= 1 / self.full_scale
+        return block
+
+    def from_float(self, block: np.ndarray) -> bytes:
+        """:returns block, with full scale being 1.0, as the raw bytes of this format."""
+
+        if self.is_float:
+            return block.astype(np.float32, copy=False).tobytes()
+        # float64, so 32-bit full scale does not round up past the int32 maximum.
+        samples = np.rint(block.astype(np.float64) * self.full_scale)
+        np.clip(samples, self.min_value, self.max_value, out=samples)
+        if self.sample_width == 3:
+            return samples.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        return samples.astype(self.dtype).tobytes()
+
+
+SAMPLE_FORMATS = {
+    pyaudio.paInt16: SampleFormat(pyaudio.paInt16, 2, "<i2", 2.0 ** 15),
+    pyaudio.paInt24: SampleFormat(pyaudio.paInt24, 3, "<i4", 2.0 ** 23),
+    pyaudio.paInt32: SampleFormat(pyaudio.paInt32, 4, "<i4", 2.0 ** 31),
+    pyaudio.paFloat32: SampleFormat(pyaudio.paFloat32, 4, "<f4", 1.0, is_float=True),
+}
+
+
+def get_sample_format(pa_format: int) -> SampleFormat:
+    """:returns the SampleFormat of a PortAudio sample format. Raises ValueError if it is
+    not one of SAMPLE_FORMATS."""
+
+    try:
+        return SAMPLE_FORMATS[pa_format]
+    except KeyError:
+        raise ValueError("Unsupported sample format %r." % pa_format) from None
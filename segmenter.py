@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains segmented recording: a writer that rolls a long recording over
+to a new file by duration, size or wall-clock boundary."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import logging
+import math
+import os
+import queue
+import threading
+import time
+
+from recovery import RecordingJournal
+from wavWriter import StreamingWavWriter
+
+# {stem} and {ext} come from the path chosen for the recording, {index} counts the
+# segments from 1, and {time} is the wall-clock time the segment starts at.
+DEFAULT_TEMPLATE = "{stem}_{index:03d}{ext}"
+TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentPolicy:
+    """This class describes when a recording rolls over to a new segment: after
+    max_seconds of audio, before a file grows past max_bytes, or when the wall clock
+    reaches a multiple of clock_seconds (e.g. 3600 for every hour, on the hour), whichever
+    comes first. keep is how many of the newest segments the retention policy keeps
+    (None keeps them all). template names the segments, see DEFAULT_TEMPLATE."""
+
+    def __init__(self, max_seconds: float = None, max_bytes: int = None, clock_seconds: float = None,
+                 keep: int = None, template: str = DEFAULT_TEMPLATE):
+        for name, value in (("duration", max_seconds), ("size", max_bytes), ("clock interval", clock_seconds),
+                            ("number of segments to keep", keep)):
+            if value is not None and value <= 0:
+                raise ValueError("The segment %s must be positive." % name)
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.clock_seconds = clock_seconds
+        self.keep = keep
+        self.template = template
+
+    def is_enabled(self) -> bool:
+        return any(value is not None for value in (self.max_seconds, self.max_bytes, self.clock_seconds))
+
+    def get_segment_path(self, filepath: str, index: int, start_time: float) -> str:
+        stem, ext = os.path.splitext(filepath)
+        name = self.template.format(stem=os.path.basename(stem), ext=ext, index=index,
+                                    time=time.strftime(TIME_FORMAT, time.localtime(start_time)))
+        return os.path.join(os.path.dirname(filepath), name)
+
+
+class SegmentRetention:
+    """This class deletes the oldest finished segments, so that only the newest keep of
+    them remain. add() may be called from any thread."""
+
+    def __init__(self, keep: int = None):
+        self.keep = keep
+        self.paths = []
+        self.lock = threading.Lock()
+
+    def add(self, path: str):
+        with self.lock:
+            self.paths.append(path)
+            if self.keep is None:
+                return
+            pruned, self.paths = self.paths[:-self.keep], self.paths[-self.keep:]
+        for old_path in pruned:
+            try:
+                os.remove(old_path)
+                logger.info("segments: pruned %s", old_path)
+            except OSError as e:
+                logger.warning("segments: could not prune %s: %s", old_path, e)
+
+
+class SegmentedWavWriter:
+    """This class has the interface of StreamingWavWriter, but spreads the recording over
+    a series of files, each one written by its own StreamingWavWriter.
+
+    Chunks are split at the exact frame where a segment ends, so every frame goes to
+    exactly one segment and the segments join without a gap or an overlap. Wall-clock
+    boundaries are followed in audio time (the start time of the first segment plus the
+    frames written), so they never drift from the audio.
+
+    Rolling over never touches the disk on the calling thread (the recording thread).
+    While a segment is being written, the segment finalizer thread already opens the next
+    one, whose start time is known from the policy, and a segment only rolls over when
+    the first chunk after it is full arrives, so a recording that stops on a boundary
+    leaves no empty segment. The full segment is handed to the finalizer thread, which
+    waits for its queued chunks, patches its header, and then calls on_segment(path,
+    recording_path, error, is_last). A next segment opened but never reached is deleted. recording_path
+    is the file actually written: path + recording_suffix (e.g. ".part.wav" for segments
+    that are encoded afterwards), and is_last is True for the segment closed by close().
+
+    Each segment's writer gets sync_interval, and a RecordingJournal in journal_dir if it
+    is set, so a crash loses at most the end of the current segment.
+
+    Errors raised while finalizing a segment are re-raised on the next call to write()
+    or close()."""
+
+    def __init__(self, filepath: str, channels: int, sample_width: int, frame_rate: int, policy: SegmentPolicy,
+                 is_float: bool = False, on_segment=None, recording_suffix: str = "", sync_interval: float = None,
+                 journal_dir: str = None):
+        self.filepath = filepath
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+        self.policy = policy
+        self.is_float = is_float
+        self.on_segment = on_segment
+        self.recording_suffix = recording_suffix
+        self.sync_interval = sync_interval
+        self.journal_dir = journal_dir
+        self.block_align = channels * sample_width
+        self.index = 0
+        self.writer = None
+        self.segment_path = ""
+        self.segment_start_time = 0.0
+        self.segment_frames = 0
+        self.segment_limit = None
+        self.frames_written = 0
+        self.error = None
+        self.closed = False
+        self.finalize_queue = queue.Queue()
+        self.finalizer_thread = None
+        # Holds the next segment opened by the finalizer thread: (path, start time, writer,
+        # segment limit), or the exception raised opening it.
+        self.next_segment = queue.Queue(maxsize=1)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """Opens the first segment, and starts the segment finalizer thread."""
+
+        self.finalizer_thread = threading.Thread(target=self._finalize_loop)
+        self.finalizer_thread.setDaemon(True)
+        self.finalizer_thread.setName("Segment Finalizer Thread")
+        self.finalizer_thread.start()
+        self._set_segment(*self._open_segment(1, time.time()))
+
+    def write(self, data: bytes):
+        """Queues a chunk of interleaved frames, rolling over to new segments inside it
+        where the policy says so."""
+
+        self._raise_error()
+        if self.closed:
+            raise ValueError("Cannot write to a closed SegmentedWavWriter.")
+        view = memoryview(data).cast("B")
+        while len(view):
+            if self.segment_limit is not None and self.segment_frames >= self.segment_limit:
+                self._roll()
+            frames_left = None if self.segment_limit is None else self.segment_limit - self.segment_frames
+            if frames_left is None or len(view) <= frames_left * self.block_align:
+                self._write_to_segment(data if len(view) == len(data) else bytes(view))
+                return
+            split = frames_left * self.block_align
+            self._write_to_segment(bytes(view[:split]))
+            view = view[split:]
+
+    def close(self):
+        """Finalizes the last segment, and waits for the finalizer thread to finish all of
+        them. Calling close() more than once has no effect."""
+
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer is not None:
+            self.finalize_queue.put((self._finalize_segment, (self.writer, self.segment_path, True)))
+            self.writer = None
+            if self.segment_limit is not None:
+                self.finalize_queue.put((self._discard_next_segment, ()))
+        if self.finalizer_thread is not None:
+            self.finalize_queue.put(None)
+            self.finalizer_thread.join()
+        self._raise_error()
+
+    def get_frames_written(self) -> int:
+        return self.frames_written
+
+    def get_queue_depth(self) -> int:
+        return self.writer.get_queue_depth() if self.writer is not None else 0
+
+    def _write_to_segment(self, data: bytes):
+        self.writer.write(data)
+        frames = len(data) // self.block_align
+        self.segment_frames += frames
+        self.frames_written += frames
+
+    def _roll(self):
+        """Hands the full segment to the finalizer thread, and switches to the next one,
+        which the finalizer thread has normally opened long before."""
+
+        self.finalize_queue.put((self._finalize_segment, (self.writer, self.segment_path, False)))
+        self.writer = None
+        next_segment = self.next_segment.get()
+        if isinstance(next_segment, Exception):
+            raise next_segment
+        self._set_segment(*next_segment)
+
+    def _set_segment(self, path: str, start_time: float, writer: StreamingWavWriter, segment_limit: int):
+        """Makes the given segment the one written to, and has the finalizer thread open
+        the one after it, if this one can fill up."""
+
+        self.index += 1
+        self.segment_path = path
+        self.segment_start_time = start_time
+        self.writer = writer
+        self.segment_limit = segment_limit
+        self.segment_frames = 0
+        logger.info("segments: started %s", path)
+        if segment_limit is not None:
+            self.finalize_queue.put((self._prepare_next_segment,
+                                     (self.index + 1, start_time + segment_limit / self.frame_rate)))
+
+    def _open_segment(self, index: int, start_time: float) -> tuple:
+        """Creates the segment file (and its journal) for the segment starting at
+        start_time, and :returns (path, start time, writer, segment limit)."""
+
+        path = self.policy.get_segment_path(self.filepath, index, start_time)
+        recording_path = path + self.recording_suffix
+        journal = None
+        if self.journal_dir is not None:
+            journal = RecordingJournal(self.journal_dir, recording_path, path, self.channels,
+                                       self.sample_width, self.frame_rate, self.is_float)
+        writer = StreamingWavWriter(recording_path, self.channels, self.sample_width, self.frame_rate,
+                                    is_float=self.is_float, sync_interval=self.sync_interval, journal=journal)
+        writer.open()
+        return path, start_time, writer, self._get_segment_limit(start_time, writer.header_size)
+
+    def _get_segment_limit(self, start_time: float, header_size: int) -> int:
+        """:returns the number of frames the segment starting at start_time ends after,
+        or None if it only ends with the recording."""
+
+        limits = []
+        if self.policy.max_seconds is not None:
+            limits.append(int(round(self.policy.max_seconds * self.frame_rate)))
+        if self.policy.max_bytes is not None:
+            limits.append((self.policy.max_bytes - header_size) // self.block_align)
+        if self.policy.clock_seconds is not None:
+            clock = self.policy.clock_seconds
+            frames = int(round((math.floor(start_time / clock) + 1) * clock * self.frame_rate
+                               - start_time * self.frame_rate))
+            limits.append(frames if frames > 0 else int(round(clock * self.frame_rate)))
+        return max(1, min(limits)) if limits else None
+
+    def _finalize_loop(self):
+        """Segment finalizer thread runs this function. Each item is a (function, args)
+        pair to run; a None item ends it."""
+
+        while True:
+            item = self.finalize_queue.get()
+            if item is None:
+                return
+            function, args = item
+            function(*args)
+
+    def _prepare_next_segment(self, index: int, start_time: float):
+        try:
+            self.next_segment.put(self._open_segment(index, start_time))
+        except Exception as e:
+            self.next_segment.put(e)
+
+    def _discard_next_segment(self):
+        """Deletes the next segment, opened but never written to, as the recording ended
+        before it."""
+
+        next_segment = self.next_segment.get()
+        if isinstance(next_segment, Exception):
+            return
+        writer = next_segment[2]
+        try:
+            writer.close()
+            os.remove(writer.filepath)
+            if writer.journal is not None:
+                writer.journal.remove()
+        except Exception as e:
+            logger.warning("segments: could not delete the unused segment %s: %s", writer.filepath, e)
+
+    def _finalize_segment(self, writer: StreamingWavWriter, path: str, is_last: bool):
+        error = None
+        try:
+            writer.close()
+            logger.info("segments: finished %s (%d frames)", path, writer.get_frames_written())
+        except Exception as e:
+            error = e
+            if self.error is None:
+                self.error = e
+        if self.on_segment is not None:
+            try:
+                self.on_segment(path, writer.filepath, error, is_last)
+            except Exception:
+                logger.exception("segments: on_segment failed for %s", path)
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
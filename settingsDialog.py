@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the settings dialog, used to pick the input device configuration."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+from PyQt5 import QtGui, QtWidgets
+from PyQt5.QtWidgets import QMainWindow
+
+from bufferSizer import BUFFER_SIZES
+from deviceCatalog import COMMON_RATES, InputDevice, SAMPLE_FORMAT_NAMES
+from dynamicLabels import ColorChangingLabel, CustomButton
+from framelessDialog import FramelessDialog
+from recorderEngine import CHUNK, RecorderEngine, SUPPORTED_SAMPLE_FORMATS
+from recorderState import IllegalTransitionError
+from segmenter import SegmentPolicy
+from voiceActivity import MODE_SKIP, MODE_TRIGGER
+
+# The pre-roll lengths offered, in seconds.
+PREROLL_CHOICES = (2, 5, 10, 30)
+# key: (text, (max_seconds, clock_seconds)) of the segment policies offered.
+SPLIT_CHOICES = {
+    "off": ("Off", None),
+    "600": ("Every 10 minutes", (600, None)),
+    "1800": ("Every 30 minutes", (1800, None)),
+    "3600": ("Every hour", (3600, None)),
+    "clock3600": ("On the hour", (None, 3600)),
+}
+# The voice activity modes offered; "off" records everything.
+SILENCE_CHOICES = (("Keep", "off"), ("Skip", MODE_SKIP), ("Wait for sound", MODE_TRIGGER))
+
+
+class SettingsDialog(FramelessDialog):
+    """This class is the settings dialog. It lists the input devices from the engine's
+    device catalog, and the rates, channel counts and sample formats the selected device
+    supports. The output device is only displayed.
+
+    The dialog does not change the engine itself: when it is accepted (with "ok"),
+    get_selection() :returns the chosen configuration, get_output_rate() the rate to save
+    recordings at (None for the capture rate), get_routing() the channels to save,
+    get_buffer() the capture buffer size, get_preroll() the seconds of pre-roll,
+    get_segment_policy() how recordings are split, and get_voice_activity() what is done
+    with silence. While a recording is underway the choices are disabled. "refresh"
+    enumerates the devices again, for devices that were plugged in after the catalog was
+    built."""
+
+    def __init__(self, master: QMainWindow = None, engine: RecorderEngine = None, normal_bg: QtGui.QColor = None,
+                 highlight_bg: QtGui.QColor = None, normal_color: QtGui.QColor = None,
+                 highlight_color: QtGui.QColor = None, current_font: QtGui.QFont = None):
+        self.engine = engine
+        super(SettingsDialog, self).__init__(master, "Output:\n%s" % engine.output_device_name, normal_bg,
+                                             highlight_bg, normal_color, highlight_color, "Settings", current_font)
+        self.devices = []
+        self._init_form()
+        self.ok_button_label.func = self.accept
+
+        self.refresh_button_label = CustomButton(func=self.refresh_devices)
+        self.refresh_button_label.set_all_colors(self.normal_bg, self.highlight_bg, self.normal_color,
+                                                 self.highlight_color)
+        self.refresh_button_label.setFont(self.current_font)
+        self.refresh_button_label.setText("  refresh  ")
+        self.bottom_frame_layout.insertWidget(0, self.refresh_button_label)
+
+        self.populate_devices()
+        if self.engine.state.is_active():
+            for combo_box in (self.device_combo_box, self.rate_combo_box, self.channels_combo_box,
+                              self.format_combo_box, self.output_rate_combo_box, self.routing_combo_box,
+                              self.buffer_combo_box, self.preroll_combo_box, self.split_combo_box,
+                              self.silence_combo_box):
+                combo_box.setEnabled(False)
+            self.refresh_button_label.hide()
+
+    def _init_form(self):
+        self.form_frame = QtWidgets.QFrame()
+        self.form_layout = QtWidgets.QFormLayout()
+        self.form_layout.setContentsMargins(8, 0, 8, 0)
+
+        self.device_combo_box = self._create_combo_box()
+        self.rate_combo_box = self._create_combo_box()
+        self.channels_combo_box = self._create_combo_box()
+        self.format_combo_box = self._create_combo_box()
+        self.output_rate_combo_box = self._create_combo_box()
+        self.routing_combo_box = self._create_combo_box()
+        self.buffer_combo_box = self._create_combo_box()
+        self.preroll_combo_box = self._create_combo_box()
+        self.split_combo_box = self._create_combo_box()
+        self.silence_combo_box = self._create_combo_box()
+        self._fill(self.buffer_combo_box,
+                   [("%d frames" % frames, frames) for frames in BUFFER_SIZES] + [("Adaptive", "adaptive")],
+                   "adaptive" if self.engine.adaptive_buffer else self.engine.chunk, CHUNK)
+        if self.engine.use_callback_capture:
+            self._fill(self.preroll_combo_box,
+                       [("Off", 0.0)] + [("%d s" % seconds, float(seconds)) for seconds in PREROLL_CHOICES],
+                       float(self.engine.preroll_seconds), 0.0)
+        else:
+            self.preroll_combo_box.addItem("Needs callback capture", 0.0)
+            self.preroll_combo_box.setEnabled(False)
+        self._fill(self.split_combo_box, [(text, key) for key, (text, _) in SPLIT_CHOICES.items()],
+                   self._get_split_key(self.engine.segment_policy), "off")
+        self._fill(self.silence_combo_box, list(SILENCE_CHOICES), self.engine.vad_mode or "off", "off")
+        self._fill(self.output_rate_combo_box,
+                   [("Same as input", 0)] + [("%d Hz" % rate, rate) for rate in COMMON_RATES],
+                   self.engine.output_rate or 0, 0)
+        self.device_combo_box.currentIndexChanged.connect(self.populate_device_options)
+        self.channels_combo_box.currentIndexChanged.connect(self.populate_routing)
+
+        for text, combo_box in (("Input:", self.device_combo_box), ("Rate:", self.rate_combo_box),
+                                ("Channels:", self.channels_combo_box), ("Format:", self.format_combo_box),
+                                ("Save rate:", self.output_rate_combo_box),
+                                ("Save channels:", self.routing_combo_box), ("Buffer:", self.buffer_combo_box),
+                                ("Pre-roll:", self.preroll_combo_box), ("Split:", self.split_combo_box),
+                                ("Silence:", self.silence_combo_box)):
+            label = ColorChangingLabel(self.normal_bg, self.highlight_bg, self.normal_color, self.highlight_color,
+                                       False)
+            label.setFont(self.current_font)
+            label.setText(text)
+            self.form_layout.addRow(label, combo_box)
+
+        self.form_frame.setLayout(self.form_layout)
+        self.main_frame_layout.insertWidget(1, self.form_frame)
+
+    def _create_combo_box(self) -> QtWidgets.QComboBox:
+        combo_box = QtWidgets.QComboBox()
+        combo_box.setFont(self.current_font)
+        combo_box.setMinimumWidth(220)
+        combo_box.setStyleSheet(self.theme.combo_box_style_sheet)
+        return combo_box
+
+    def populate_devices(self):
+        """Fills the device list from the catalog, selecting the engine's current device."""
+
+        self.devices = self.engine.get_input_devices()
+        self.device_combo_box.blockSignals(True)
+        self.device_combo_box.clear()
+        for device in self.devices:
+            self.device_combo_box.addItem(device.get_display_name(), device.index)
+        current = self.device_combo_box.findData(self.engine.input_device_idx)
+        self.device_combo_box.setCurrentIndex(max(current, 0))
+        self.device_combo_box.blockSignals(False)
+        self.populate_device_options()
+
+    def populate_device_options(self):
+        """Fills the rate, channels and format lists with what the selected device supports,
+        keeping the engine's current values selected where possible."""
+
+        device = self.get_selected_device()
+        if device is None:
+            return
+        self._fill(self.rate_combo_box, [("%d Hz" % rate, rate) for rate in device.rates], self.engine.rate,
+                   device.default_rate)
+        self._fill(self.channels_combo_box, [(str(channels), channels) for channels in device.channel_counts],
+                   self.engine.input_channels, device.max_input_channels)
+        self._fill(self.format_combo_box, [(SAMPLE_FORMAT_NAMES[sample_format], sample_format)
+                                           for sample_format in device.sample_formats
+                                           if sample_format in SUPPORTED_SAMPLE_FORMATS],
+                   self.engine.sample_format, SUPPORTED_SAMPLE_FORMATS[0])
+
+    def populate_routing(self):
+        """Fills the routing list for the selected channel count: all the channels, a mono
+        mix of them, or any single channel."""
+
+        channels = self.channels_combo_box.currentData()
+        if channels is None:
+            return
+        items = [("All", "all")]
+        if channels > 1:
+            items.append(("Mono mix", "mono"))
+            items += [("Channel %d" % (channel + 1), str(channel)) for channel in range(channels)]
+        current = "mono" if self.engine.route_mono else "all"
+        if self.engine.route_channels is not None and len(self.engine.route_channels) == 1:
+            current = str(self.engine.route_channels[0])
+        self._fill(self.routing_combo_box, items, current, "all")
+
+    @staticmethod
+    def _fill(combo_box: QtWidgets.QComboBox, items: [(str, object)], current, default):
+        combo_box.clear()
+        for text, data in items:
+            combo_box.addItem(text, data)
+        index = combo_box.findData(current)
+        if index < 0:
+            index = combo_box.findData(default)
+        combo_box.setCurrentIndex(max(index, 0))
+
+    def get_selected_device(self) -> InputDevice:
+        index = self.device_combo_box.currentIndex()
+        return self.devices[index] if 0 <= index < len(self.devices) else None
+
+    def get_selection(self) -> (int, int, int, int):
+        """:returns the selected (device index, rate, channels, sample format), or None if
+        the device has no usable configuration."""
+
+        values = (self.device_combo_box.currentData(), self.rate_combo_box.currentData(),
+                  self.channels_combo_box.currentData(), self.format_combo_box.currentData())
+        return None if None in values else values
+
+    def get_output_rate(self) -> int:
+        """:returns the selected rate to save recordings at, or None for the capture rate."""
+
+        return self.output_rate_combo_box.currentData() or None
+
+    def get_routing(self) -> ([int], bool):
+        """:returns the selected (channels to save, mono), for RecorderEngine.set_routing()."""
+
+        routing = self.routing_combo_box.currentData()
+        if routing in (None, "all", "mono"):
+            return None, routing == "mono"
+        return [int(routing)], False
+
+    def get_buffer(self) -> (int, bool):
+        """:returns the selected (buffer size, adaptive), for RecorderEngine.set_buffer_size().
+        Adaptive sizing starts from the current buffer size."""
+
+        frames = self.buffer_combo_box.currentData()
+        if frames == "adaptive":
+            return self.engine.chunk, True
+        return frames, False
+
+    def get_preroll(self) -> float:
+        """:returns the selected pre-roll in seconds, 0 for none."""
+
+        return self.preroll_combo_box.currentData() or 0.0
+
+    def get_segment_policy(self) -> SegmentPolicy:
+        """:returns the selected segment policy, or None to record to a single file. A
+        policy set elsewhere (e.g. by size) is kept if the list was not changed."""
+
+        key = self.split_combo_box.currentData()
+        if key == self._get_split_key(self.engine.segment_policy):
+            return self.engine.segment_policy
+        limits = SPLIT_CHOICES.get(key, ("", None))[1]
+        return None if limits is None else SegmentPolicy(max_seconds=limits[0], clock_seconds=limits[1])
+
+    def get_voice_activity(self) -> str:
+        """:returns the selected voice activity mode, or None to keep the silence."""
+
+        mode = self.silence_combo_box.currentData()
+        return None if mode == "off" else mode
+
+    @staticmethod
+    def _get_split_key(policy: SegmentPolicy) -> str:
+        if policy is None:
+            return "off"
+        limits = (policy.max_seconds, policy.clock_seconds)
+        return next((key for key, (_, choice) in SPLIT_CHOICES.items() if choice == limits), "off")
+
+    def refresh_devices(self):
+        try:
+            self.engine.refresh_devices()
+        except (IllegalTransitionError, OSError) as e:
+            self.message_label.setText(str(e))
+            return
+        self.message_label.setText("Output:\n%s" % self.engine.output_device_name)
+        self.populate_devices()
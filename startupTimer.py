@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains a small timer used to measure and log the startup phases."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """This class records how long each startup phase took.
+
+    mark(phase) records the time since the timer was created, and logs it at INFO level
+    together with the time since the previous mark. It can be called from any thread,
+    so phases that run in the background (like PortAudio initialization) can be marked
+    too. report() :returns all the phases as a single string."""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.phases = []
+        self.lock = threading.Lock()
+
+    def mark(self, phase: str) -> float:
+        """Records the end of phase, and :returns the milliseconds since the timer started."""
+
+        now = time.perf_counter()
+        with self.lock:
+            since_start = (now - self.start_time) * 1000
+            since_last = (now - self.last_time) * 1000
+            self.last_time = now
+            self.phases.append((phase, since_start))
+        logger.info("startup: %s at %.1f ms (+%.1f ms)", phase, since_start, since_last)
+        return since_start
+
+    def report(self) -> str:
+        with self.lock:
+            return ", ".join("%s %.1f ms" % phase for phase in self.phases)
+
+
+# The timer starts when this module is first imported, which the app does before anything else.
+startup_timer = StartupTimer()
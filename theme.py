@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the themes: the stylesheets and palettes of the minimalist UI,
+precomputed once per set of colors."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import functools
+
+from PyQt5 import QtGui
+
+
+def get_rgb_string(color: QtGui.QColor) -> str:
+    return "%d, %d, %d" % (color.red(), color.green(), color.blue())
+
+
+class Theme:
+    """This class holds the four colors of the UI, and every stylesheet and palette made
+    from them.
+
+    The stylesheets and palettes are made once, when the theme is created. Labels are
+    not styled with stylesheets at all: their normal and highlighted looks are two
+    QPalettes, so hovering only swaps a palette, which is far cheaper than having Qt
+    parse a stylesheet and repolish the label. For the same reason frame_style_sheet only
+    matches plain QFrames (".QFrame"), not the QLabels inside them. Use get_theme() rather
+    than the constructor, so that every widget with the same colors shares one Theme."""
+
+    def __init__(self, normal_bg: QtGui.QColor, highlight_bg: QtGui.QColor, normal_color: QtGui.QColor,
+                 highlight_color: QtGui.QColor):
+        self.normal_bg = QtGui.QColor(normal_bg)
+        self.highlight_bg = QtGui.QColor(highlight_bg)
+        self.normal_color = QtGui.QColor(normal_color)
+        self.highlight_color = QtGui.QColor(highlight_color)
+        normal_bg_rgb, highlight_bg_rgb, normal_color_rgb, highlight_color_rgb = (
+            get_rgb_string(color) for color in (normal_bg, highlight_bg, normal_color, highlight_color))
+
+        self.normal_palette = self._get_palette(self.normal_bg, self.normal_color)
+        self.highlight_palette = self._get_palette(self.highlight_bg, self.highlight_color)
+        self.frame_style_sheet = """
+        .QFrame{
+        background-color: rgba(%s,255);
+        }""" % normal_bg_rgb
+        self.dialog_style_sheet = """
+        QDialog{
+        background-color: rgba(%s,255);
+        border: 1px solid white;
+        }""" % normal_bg_rgb
+        self.combo_box_style_sheet = """
+        QComboBox, QComboBox QAbstractItemView {
+        color: rgba(%s, 255);
+        background-color: rgba(%s, 255);
+        selection-color: rgba(%s, 255);
+        selection-background-color: rgba(%s, 255);
+        border: 1px solid rgba(%s, 255);
+        }""" % (normal_color_rgb, normal_bg_rgb, highlight_color_rgb, highlight_bg_rgb, normal_color_rgb)
+        self.banner_style_sheet = """
+        QLabel {
+        color: rgba(%s, 255);
+        background-color: rgba(%s, 255);
+        padding: 6px;
+        }""" % (normal_bg_rgb, highlight_bg_rgb)
+
+    @staticmethod
+    def _get_palette(background: QtGui.QColor, foreground: QtGui.QColor) -> QtGui.QPalette:
+        palette = QtGui.QPalette()
+        palette.setColor(QtGui.QPalette.Window, background)
+        palette.setColor(QtGui.QPalette.WindowText, foreground)
+        return palette
+
+
+@functools.lru_cache(maxsize=None)
+def _get_theme(colors: tuple) -> Theme:
+    return Theme(*(QtGui.QColor(*rgb) for rgb in colors))
+
+
+def get_theme(normal_bg: QtGui.QColor, highlight_bg: QtGui.QColor, normal_color: QtGui.QColor,
+              highlight_color: QtGui.QColor) -> Theme:
+    """:returns the shared Theme of these colors, creating it the first time."""
+
+    return _get_theme(tuple((color.red(), color.green(), color.blue())
+                            for color in (normal_bg, highlight_bg, normal_color, highlight_color)))
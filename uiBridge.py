@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the bridge used by worker threads to update the UI."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import threading
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt
+
+
+class UiBridge(QtCore.QObject):
+    """This class marshals UI updates from worker threads onto the GUI thread.
+
+    Worker threads call post(field, value) and never touch widgets themselves. The GUI
+    thread delivers the posted values to the handlers registered with connect(), at most
+    once per frame (frame_rate times a second). For coalescing fields only the latest
+    value posted during a frame is delivered, so a burst of updates costs a single
+    repaint. Non-coalescing fields (such as errors) deliver every value, in order.
+
+    The bridge must be created on the GUI thread."""
+
+    flush_requested = QtCore.pyqtSignal()
+
+    def __init__(self, parent: QtCore.QObject = None, frame_rate: int = 60):
+        super(UiBridge, self).__init__(parent)
+        self.lock = threading.Lock()
+        self.handlers = {}
+        self.coalesce = {}
+        self.pending = {}
+        self.flush_scheduled = False
+
+        self.flush_timer = QtCore.QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(int(1000 / frame_rate))
+        self.flush_timer.timeout.connect(self.flush)
+        # Emitting from a worker thread queues the call onto the GUI thread's event loop.
+        self.flush_requested.connect(self.flush_timer.start, Qt.QueuedConnection)
+
+    def connect(self, field: str, handler, coalesce: bool = True):
+        """Registers handler to be called on the GUI thread with the values posted to field."""
+
+        self.handlers[field] = handler
+        self.coalesce[field] = coalesce
+
+    def post(self, field: str, value=None):
+        """Posts a value for field. This is safe to call from any thread."""
+
+        with self.lock:
+            if self.coalesce.get(field, True):
+                self.pending[field] = value
+            else:
+                self.pending.setdefault(field, []).append(value)
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        self.flush_requested.emit()
+
+    def flush(self):
+        """Delivers the pending values to their handlers. Runs on the GUI thread."""
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flush_scheduled = False
+        for field, value in pending.items():
+            handler = self.handlers.get(field)
+            if handler is None:
+                continue
+            if self.coalesce.get(field, True):
+                handler(value)
+            else:
+                for item in value:
+                    handler(item)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the voice activity detection stage, used to leave silence out of
+recordings, or to only record while there is sound."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import json
+
+import numpy as np
+
+# skip: silent spans are cut down to the hangover and padding around the sound.
+# trigger: the recording waits for sound, and goes back to waiting after a long silence.
+MODE_SKIP = "skip"
+MODE_TRIGGER = "trigger"
+# mode: (hangover seconds, padding seconds)
+MODE_DEFAULTS = {MODE_SKIP: (0.3, 0.2), MODE_TRIGGER: (3.0, 0.5)}
+# The length of the frames the levels are measured over, in seconds.
+FRAME_SECONDS = 0.02
+THRESHOLD_DB = -45.0
+# Sound has to fall this far below the threshold to count as silence again.
+HYSTERESIS_DB = 6.0
+# Keeps the log of a power of zero finite.
+POWER_FLOOR = 1e-12
+
+
+class VoiceActivityDetector:
+    """This class is a ProcessingChain stage that drops the silent parts of a recording.
+
+    The input is cut into frames of FRAME_SECONDS, and the level of each one (its mean
+    power over all channels, in dBFS) is computed for all the frames of a chunk at once.
+    Sound starts when a frame reaches threshold_db, and ends after hangover seconds below
+    threshold_db - hysteresis_db, so short pauses between words are kept. The padding
+    seconds of silence before each start are kept too, so the onsets are not cut. With
+    max_flatness, a frame must also have a spectral flatness (0 for a pure tone, 1 for
+    white noise) of at most max_flatness to start sound, which keeps steady noise such as
+    a fan from triggering it.
+
+    Only whole frames are decided, so up to one frame is held back until the next chunk
+    or flush(). Every start and end is kept in spans (in seconds of input), which
+    write_log() saves as JSON. on_change(active, seconds), if set, is called from the
+    recording thread whenever sound starts or ends."""
+
+    def __init__(self, rate: int, channels: int, mode: str = MODE_SKIP, threshold_db: float = THRESHOLD_DB,
+                 hysteresis_db: float = HYSTERESIS_DB, hangover: float = None, padding: float = None,
+                 max_flatness: float = None):
+        if mode not in MODE_DEFAULTS:
+            raise ValueError("Unknown voice activity mode %r." % mode)
+        default_hangover, default_padding = MODE_DEFAULTS[mode]
+        self.rate = rate
+        self.output_channels = channels
+        self.mode = mode
+        self.threshold_db = threshold_db
+        self.release_db = threshold_db - hysteresis_db
+        self.hangover = default_hangover if hangover is None else hangover
+        self.padding = default_padding if padding is None else padding
+        self.max_flatness = max_flatness
+        self.frame_size = max(1, int(round(FRAME_SECONDS * rate)))
+        self.hangover_frames = int(round(self.hangover * rate / self.frame_size))
+        self.padding_size = int(round(self.padding * rate))
+        self.on_change = None
+        self.active = False
+        self.quiet_frames = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.spans = []
+        self.pending = np.zeros((0, channels), dtype=np.float32)
+        self.lookback = np.zeros((0, channels), dtype=np.float32)
+        self.window = np.hanning(self.frame_size).astype(np.float32)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if len(self.pending):
+            block = np.concatenate((self.pending, block))
+        count = len(block) // self.frame_size
+        self.pending = block[count * self.frame_size:].copy()
+        if not count:
+            return block[:0]
+        frames = block[:count * self.frame_size]
+        voiced = self._decide(frames.reshape(count, self.frame_size, -1))
+        return self._gate(frames, voiced)
+
+    def flush(self) -> np.ndarray:
+        """:returns the frame held back, if the recording ends with sound."""
+
+        block, self.pending = self.pending, self.pending[:0]
+        self.frames_in += len(block)
+        if self.active:
+            self.frames_out += len(block)
+            self._end_span()
+            return block
+        return block[:0]
+
+    def get_levels(self, frames: np.ndarray) -> np.ndarray:
+        """:returns the level of each frame of frames (shape (count, frame_size,
+        channels)), in dBFS."""
+
+        power = np.einsum("fsc,fsc->f", frames, frames) / (frames.shape[1] * frames.shape[2])
+        return 10 * np.log10(power + POWER_FLOOR)
+
+    def get_flatness(self, frames: np.ndarray) -> np.ndarray:
+        """:returns the spectral flatness of each frame of frames, mixed down to mono."""
+
+        spectrum = np.abs(np.fft.rfft(frames.mean(axis=2) * self.window, axis=1)) ** 2 + POWER_FLOOR
+        return np.exp(np.log(spectrum).mean(axis=1)) / spectrum.mean(axis=1)
+
+    def is_active(self) -> bool:
+        return self.active
+
+    def get_log(self) -> dict:
+        return {
+            "mode": self.mode,
+            "threshold_db": self.threshold_db,
+            "release_db": self.release_db,
+            "hangover": self.hangover,
+            "padding": self.padding,
+            "max_flatness": self.max_flatness,
+            "input_seconds": round(self.frames_in / self.rate, 3),
+            "output_seconds": round(self.frames_out / self.rate, 3),
+            "spans": [{"start": start, "end": end} for start, end in self.spans],
+        }
+
+    def write_log(self, path: str):
+        """Writes the decisions made so far to path as JSON."""
+
+        with open(path, "w") as file:
+            json.dump(self.get_log(), file, indent=2)
+
+    def _decide(self, frames: np.ndarray) -> np.ndarray:
+        """:returns whether each frame is kept as sound. The levels are computed for all
+        frames at once; only the hysteresis walks them one by one."""
+
+        levels = self.get_levels(frames)
+        loud = levels >= self.threshold_db
+        if self.max_flatness is not None and loud.any():
+            loud &= self.get_flatness(frames) <= self.max_flatness
+        audible = levels >= self.release_db
+        voiced = np.empty(len(levels), dtype=bool)
+        for i in range(len(levels)):
+            if self.active:
+                self.quiet_frames = 0 if audible[i] else self.quiet_frames + 1
+                if self.quiet_frames > self.hangover_frames:
+                    self._set_active(False, self.frames_in + i * self.frame_size)
+            elif loud[i]:
+                self.quiet_frames = 0
+                self._set_active(True, self.frames_in + i * self.frame_size)
+            voiced[i] = self.active
+        return voiced
+
+    def _gate(self, frames: np.ndarray, voiced: np.ndarray) -> np.ndarray:
+        """:returns the frames decided as sound, each run of them preceded by the padding
+        kept from the silence before it."""
+
+        self.frames_in += len(frames)
+        # The indices where the decision changes split the chunk into runs.
+        bounds = np.flatnonzero(np.diff(voiced)) + 1
+        parts = []
+        start = 0
+        for end in list(bounds) + [len(voiced)]:
+            run = frames[start * self.frame_size:end * self.frame_size]
+            if voiced[start]:
+                if len(self.lookback):
+                    parts.append(self.lookback)
+                    self.lookback = self.lookback[:0]
+                parts.append(run)
+            elif self.padding_size:
+                self.lookback = np.concatenate((self.lookback, run))[-self.padding_size:]
+            start = end
+        if not parts:
+            return frames[:0]
+        output = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        self.frames_out += len(output)
+        return output
+
+    def _set_active(self, active: bool, frame: int):
+        self.active = active
+        seconds = round(frame / self.rate, 3)
+        if active:
+            self.spans.append([round(max(0.0, seconds - self.padding), 3), None])
+        else:
+            self.spans[-1][1] = seconds
+        if self.on_change is not None:
+            self.on_change(active, seconds)
+
+    def _end_span(self):
+        if self.spans and self.spans[-1][1] is None:
+            self.spans[-1][1] = round(self.frames_in / self.rate, 3)
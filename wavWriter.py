@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains a streaming .wav writer that writes audio to disk as it is
+recorded, instead of buffering the whole recording in memory."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# The KSDATAFORMAT_SUBTYPE GUIDs are the format tag followed by these 12 bytes.
+SUBFORMAT_GUID_SUFFIX = b"\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
+# Speaker positions for mono and stereo; other layouts are left unassigned.
+CHANNEL_MASKS = {1: 0x4, 2: 0x3}
+# The largest size a RIFF chunk can declare; larger files are promoted to RF64 (EBU Tech 3306).
+MAX_RIFF_SIZE = 0xFFFFFFFF
+# The size of the ds64 chunk: the RIFF size, data size and sample count, and an empty table.
+# Every header reserves it as a JUNK chunk, so the promotion never moves the audio.
+DS64_SIZE = 28
+# How often a journal is touched while the file is written, in seconds. It must stay well
+# under recovery.STALE_SECONDS, or a live recording would look interrupted.
+JOURNAL_TOUCH_INTERVAL = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingWavWriter:
+    """This class writes a .wav file incrementally from a dedicated writer thread.
+
+    Chunks handed to write() are put on a bounded queue, and the writer thread appends
+    them to the file as they arrive. A placeholder header is written when the file is
+    opened, and the RIFF and data chunk sizes are patched in when the writer is closed.
+    Memory use is bounded by the queue size, no matter how long the recording runs.
+
+    16-bit mono and stereo files get a plain PCM header. Samples wider than 16 bits,
+    more than two channels, and 32-bit float samples (is_float) get a
+    WAVE_FORMAT_EXTENSIBLE header, with a fact chunk for float.
+
+    Recordings are not limited to the 4 GB of a RIFF file. Every header reserves room
+    for a ds64 chunk in a JUNK chunk, which readers skip. When the data outgrows RIFF, the
+    header is rewritten in place as RF64: "RIFF" becomes "RF64", the JUNK chunk becomes
+    the ds64 chunk with the 64-bit sizes, and the 32-bit sizes are set to 0xFFFFFFFF.
+    The header keeps its size, so the audio is never moved or copied.
+
+    With a sync_interval, the writer thread also rewrites the header with the current
+    sizes and fsyncs the file every sync_interval seconds, so that after a crash at most
+    that much audio is lost, and the file only needs its header fixed (see recovery). The
+    capture never waits for an fsync. An optional journal (a recovery.RecordingJournal)
+    is created when the file is opened, touched every JOURNAL_TOUCH_INTERVAL seconds
+    (with or without a sync_interval), and finished on close.
+
+    Errors raised on the writer thread are re-raised on the next call to write() or
+    close()."""
+
+    def __init__(self, filepath: str, channels: int, sample_width: int, frame_rate: int,
+                 max_queued_chunks: int = 64, is_float: bool = False, sync_interval: float = None,
+                 journal=None):
+        self.filepath = filepath
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+        self.is_float = is_float
+        self.sync_interval = sync_interval
+        self.journal = journal
+        self.block_align = channels * sample_width
+        self.is_extensible = is_float or sample_width > 2 or channels > 2
+        self.header_size = len(self.get_header(0))
+        self.data_size = 0
+        self.is_rf64 = False
+        self.error = None
+        self.closed = False
+        self.file = None
+        self.chunk_queue = queue.Queue(maxsize=max_queued_chunks)
+        self.writer_thread = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """Opens the file, writes the placeholder header, and starts the writer thread."""
+
+        self.file = open(self.filepath, "wb")
+        self.file.write(self.get_header(0))
+        if self.journal is not None:
+            self.journal.create()
+        self.writer_thread = threading.Thread(target=self._write_loop)
+        self.writer_thread.setDaemon(True)
+        self.writer_thread.setName("Writer Thread")
+        self.writer_thread.start()
+
+    def write(self, data: bytes):
+        """Queues a chunk of interleaved frames to be written. Blocks if the queue is full."""
+
+        self._raise_error()
+        if self.closed:
+            raise ValueError("Cannot write to a closed StreamingWavWriter.")
+        self.chunk_queue.put(data)
+
+    def close(self):
+        """Waits for the queued chunks to be written, then patches the header sizes and
+        closes the file. Calling close() more than once has no effect."""
+
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer_thread is not None:
+            self.chunk_queue.put(None)
+            self.writer_thread.join()
+        self._raise_error()
+        if self.journal is not None:
+            self.journal.finish()
+
+    def get_frames_written(self) -> int:
+        return self.data_size // self.block_align
+
+    def get_queue_depth(self) -> int:
+        """:returns how many chunks are waiting to be written."""
+
+        return self.chunk_queue.qsize()
+
+    def _write_loop(self):
+        """Writer thread runs this function. A None chunk marks the end of the recording."""
+
+        timeout = self.sync_interval
+        if self.journal is not None:
+            timeout = JOURNAL_TOUCH_INTERVAL if timeout is None else min(timeout, JOURNAL_TOUCH_INTERVAL)
+        try:
+            synced_size = 0
+            last_sync = last_touch = time.monotonic()
+            while True:
+                try:
+                    data = self.chunk_queue.get(timeout=timeout)
+                except queue.Empty:
+                    data = b""
+                if data is None:
+                    break
+                self.file.write(data)
+                self.data_size += len(data)
+                if not self.is_rf64 and self.needs_rf64(self.data_size):
+                    self.is_rf64 = True
+                    self._write_header()
+                    logger.info("wav: %s outgrew RIFF, promoted to RF64", self.filepath)
+                if self.sync_interval is not None and time.monotonic() - last_sync >= self.sync_interval:
+                    if self.data_size != synced_size:
+                        self._sync()
+                        synced_size = self.data_size
+                    last_sync = time.monotonic()
+                if self.journal is not None and time.monotonic() - last_touch >= JOURNAL_TOUCH_INTERVAL:
+                    self.journal.touch()
+                    last_touch = time.monotonic()
+        except Exception as e:
+            self.error = e
+            # Keep draining so that a producer blocked on a full queue can finish.
+            while self.chunk_queue.get() is not None:
+                pass
+            self.file.close()
+            return
+        # The end of the recording was taken off the queue, so there is nothing left to drain.
+        try:
+            self._finalize()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.file.close()
+
+    def _sync(self):
+        """Rewrites the header with the sizes written so far, and fsyncs the file."""
+
+        self._write_header()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _write_header(self):
+        self.file.seek(0)
+        self.file.write(self.get_header(self.data_size))
+        self.file.seek(0, os.SEEK_END)
+
+    def _finalize(self):
+        """Pads the data chunk to an even length and patches the header sizes."""
+
+        if self.data_size % 2:
+            self.file.write(b"\x00")
+        self.file.seek(0)
+        self.file.write(self.get_header(self.data_size))
+        self.file.flush()
+        if self.sync_interval is not None:
+            os.fsync(self.file.fileno())
+
+    def get_header(self, data_size: int) -> bytes:
+        """:returns the header for a data chunk of data_size bytes: RIFF, or RF64 if
+        needs_rf64(data_size). Both have the same size."""
+
+        frames = data_size // self.block_align
+        riff_size = self._get_riff_size(data_size)
+        if riff_size > MAX_RIFF_SIZE:
+            riff_id, reserved = b"RF64", struct.pack("<4sIQQQI", b"ds64", DS64_SIZE, riff_size, data_size, frames, 0)
+            riff_size = data_size = frames = MAX_RIFF_SIZE
+        else:
+            riff_id, reserved = b"RIFF", struct.pack("<4sI", b"JUNK", DS64_SIZE) + bytes(DS64_SIZE)
+        chunks = reserved + self._get_fmt_chunk()
+        if self.is_float:
+            chunks += struct.pack("<4sII", b"fact", 4, frames)
+        return struct.pack("<4sI4s", riff_id, riff_size, b"WAVE") + chunks + struct.pack("<4sI", b"data", data_size)
+
+    def needs_rf64(self, data_size: int) -> bool:
+        """:returns whether a data chunk of data_size bytes is too large for a RIFF file."""
+
+        return self._get_riff_size(data_size) > MAX_RIFF_SIZE
+
+    def _get_riff_size(self, data_size: int) -> int:
+        """:returns the size of the RIFF chunk holding a data chunk of data_size bytes."""
+
+        fact_size = 12 if self.is_float else 0
+        return 4 + 8 + DS64_SIZE + len(self._get_fmt_chunk()) + fact_size + 8 + data_size + (data_size % 2)
+
+    def _get_fmt_chunk(self) -> bytes:
+        format_tag = WAVE_FORMAT_IEEE_FLOAT if self.is_float else WAVE_FORMAT_PCM
+        bits = self.sample_width * 8
+        fields = (self.channels, self.frame_rate, self.frame_rate * self.block_align, self.block_align, bits)
+        if not self.is_extensible:
+            return struct.pack("<4sIHHIIHH", b"fmt ", 16, format_tag, *fields)
+        return struct.pack("<4sIHHIIHHHHI", b"fmt ", 40, WAVE_FORMAT_EXTENSIBLE, *fields, 22, bits,
+                           CHANNEL_MASKS.get(self.channels, 0)) + struct.pack("<I", format_tag) + SUBFORMAT_GUID_SUFFIX
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This file contains the min/max decimation pyramid and the live waveform widget."""
+
+__author__ = "Hannan Khan"
+__copyright__ = "Copyright 2020, Audio Recorder"
+__credits__ = ["Hannan Khan"]
+__license__ = "MIT"
+__version__ = "1.0"
+__maintainer__ = "Hannan Khan"
+__email__ = "hannankhan888@gmail.com"
+
+import threading
+
+import numpy as np
+import pyaudio
+from PyQt5 import QtGui, QtWidgets, QtCore
+
+from sampleFormats import get_sample_format
+
+
+class PyramidLevel:
+    """One level of a MinMaxPyramid. Each bucket holds the min and max of bucket_size
+    frames, and is built from factor items of the level below it."""
+
+    def __init__(self, bucket_size: int, factor: int):
+        self.bucket_size = bucket_size
+        self.factor = factor
+        self.mins = np.empty(1024, dtype=np.float32)
+        self.maxs = np.empty(1024, dtype=np.float32)
+        self.count = 0
+        self.pending_mins = np.empty(0, dtype=np.float32)
+        self.pending_maxs = np.empty(0, dtype=np.float32)
+
+    def push(self, mins: np.ndarray, maxs: np.ndarray) -> (np.ndarray, np.ndarray):
+        """Adds items from the level below, and :returns the buckets completed by them."""
+
+        if len(self.pending_mins):
+            mins = np.concatenate((self.pending_mins, mins))
+            maxs = np.concatenate((self.pending_maxs, maxs))
+        complete = len(mins) // self.factor
+        size = complete * self.factor
+        new_mins = mins[:size].reshape(complete, self.factor).min(axis=1)
+        new_maxs = maxs[:size].reshape(complete, self.factor).max(axis=1)
+        self.pending_mins = mins[size:].copy()
+        self.pending_maxs = maxs[size:].copy()
+        if complete:
+            self._store(new_mins, new_maxs)
+        return new_mins, new_maxs
+
+    def get_buckets(self, first: int) -> (np.ndarray, np.ndarray):
+        """:returns the buckets from first on, plus the partial bucket still being built."""
+
+        mins = self.mins[first:self.count]
+        maxs = self.maxs[first:self.count]
+        if len(self.pending_mins):
+            mins = np.append(mins, self.pending_mins.min())
+            maxs = np.append(maxs, self.pending_maxs.max())
+        return mins, maxs
+
+    def _store(self, mins: np.ndarray, maxs: np.ndarray):
+        needed = self.count + len(mins)
+        if needed > len(self.mins):
+            capacity = max(needed, 2 * len(self.mins))
+            self.mins = np.resize(self.mins, capacity)
+            self.maxs = np.resize(self.maxs, capacity)
+        self.mins[self.count:needed] = mins
+        self.maxs[self.count:needed] = maxs
+        self.count = needed
+
+
+class MinMaxPyramid:
+    """This class keeps a multi-resolution min/max summary of a recording.
+
+    append() is called by the recording thread with each raw interleaved chunk. The
+    channels are folded into a single envelope, and the buckets of every level are built
+    incrementally, each level from the one below it. With the default bucket sizes the
+    pyramid takes 8 bytes per 256 frames (plus a little for the coarser levels), a small
+    fraction of the audio itself.
+
+    get_envelope() picks the coarsest level that still has enough buckets for the
+    requested number of columns, so its cost depends on the number of columns and not on
+    the length of the recording."""
+
+    def __init__(self, channels: int, sample_format: int = pyaudio.paInt16,
+                 bucket_sizes: (int,) = (256, 4096, 65536)):
+        self.channels = channels
+        self.sample_format = get_sample_format(sample_format)
+        self.full_scale = self.sample_format.full_scale
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.levels = []
+        previous_size = 1
+        for bucket_size in bucket_sizes:
+            self.levels.append(PyramidLevel(bucket_size, bucket_size // previous_size))
+            previous_size = bucket_size
+
+    def append(self, data: bytes):
+        block = self.sample_format.decode(data).reshape(-1, self.channels)
+        mins = block.min(axis=1).astype(np.float32) / self.full_scale
+        maxs = block.max(axis=1).astype(np.float32) / self.full_scale
+        with self.lock:
+            self.frames += len(block)
+            for level in self.levels:
+                mins, maxs = level.push(mins, maxs)
+
+    def get_envelope(self, columns: int, last_frames: int = None) -> (np.ndarray, np.ndarray):
+        """:returns the (mins, maxs) of up to columns columns, covering the whole recording,
+        or only its last last_frames frames."""
+
+        with self.lock:
+            span = self.frames if last_frames is None else min(last_frames, self.frames)
+            level = self.levels[0]
+            for candidate in self.levels[1:]:
+                if span // candidate.bucket_size >= columns:
+                    level = candidate
+            first = max(0, level.count - -(-span // level.bucket_size))
+            mins, maxs = level.get_buckets(first)
+        if len(mins) <= columns:
+            return mins, maxs
+        edges = np.linspace(0, len(mins), columns, endpoint=False).astype(np.intp)
+        return np.minimum.reduceat(mins, edges), np.maximum.reduceat(maxs, edges)
+
+
+class WaveformView(QtWidgets.QWidget):
+    """This class draws the live waveform of the current recording from a MinMaxPyramid.
+
+    The view repaints itself refresh_rate times a second while a pyramid is set. If
+    visible_seconds is given, it scrolls and only shows that many of the latest seconds;
+    otherwise the whole recording is fit into the widget's width."""
+
+    def __init__(self, normal_bg: QtGui.QColor = None, normal_color: QtGui.QColor = None,
+                 frame_rate: int = 44100, visible_seconds: float = None, refresh_rate: int = 15):
+        super(WaveformView, self).__init__()
+        self.normal_bg = normal_bg
+        self.normal_color = normal_color
+        self.frame_rate = frame_rate
+        self.visible_seconds = visible_seconds
+        self.pyramid = None
+
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setInterval(int(1000 / refresh_rate))
+        self.refresh_timer.timeout.connect(self.update)
+
+    def set_pyramid(self, pyramid: MinMaxPyramid, frame_rate: int = None):
+        """Starts drawing pyramid. Passing None stops refreshing and clears the view."""
+
+        self.pyramid = pyramid
+        if frame_rate:
+            self.frame_rate = frame_rate
+        if pyramid is None:
+            self.refresh_timer.stop()
+        else:
+            self.refresh_timer.start()
+        self.update()
+
+    def paintEvent(self, a0: QtGui.QPaintEvent) -> None:
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.normal_bg)
+        if self.pyramid is None:
+            return
+        width = self.width()
+        last_frames = None
+        if self.visible_seconds:
+            last_frames = int(self.visible_seconds * self.frame_rate)
+        mins, maxs = self.pyramid.get_envelope(width, last_frames)
+        if not len(mins):
+            return
+        middle = self.height() / 2
+        tops = middle - np.clip(maxs, -1, 1) * middle
+        bottoms = middle - np.clip(mins, -1, 1) * middle
+        lines = [QtCore.QLineF(x, top, x, bottom) for x, top, bottom in zip(range(len(mins)), tops, bottoms)]
+        painter.setPen(self.normal_color)
+        painter.drawLines(lines)